@@ -0,0 +1,163 @@
+"""Refresh benchmarks of the client and the coordinator against the OBS API stand-in.
+
+Measures, for every combination of device count and config entry count:
+- end-to-end refresh latency of the coordinators (all entries refreshed together)
+- requests reaching the API per refresh
+- memory retained per device by the coordinator data
+- entity update throughput of the coordinator listeners: state changes per second of entities added
+  through a platform, with values changing on every dispatch
+
+Requires homeassistant to be installed, run from the repository root:
+
+    python -m benchmarks.benchmark_refresh --devices 1 10 100 --entries 1 4 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr, entity as entity_helper, entity_registry as er
+from homeassistant.helpers.entity_component import EntityComponent
+
+from custom_components.orange_internet_on_the_move.client_registry import async_get_client_registry
+from custom_components.orange_internet_on_the_move.const import CONF_USERNAME, CONF_PASSWORD
+from custom_components.orange_internet_on_the_move.dto import DeviceSnapshot
+from custom_components.orange_internet_on_the_move.sensor import (
+    OBSCoordinator, SENSOR_DESCRIPTIONS, build_device_entities,
+)
+from .obs_api_standin import ObsApiStandin, StandinConfig
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _WriteCounter:
+    """Counts the state changes written by the entities"""
+
+    def __init__(self, hass: HomeAssistant):
+        self.count = 0
+        self.cancel = hass.bus.async_listen(EVENT_STATE_CHANGED, self._count)
+
+    @callback
+    def _count(self, event: Event) -> None:
+        self.count += 1
+
+
+async def _bench_case(hass: HomeAssistant, device_count: int, entry_count: int, args) -> dict:
+    standin = ObsApiStandin(StandinConfig(devices=device_count, latency=args.latency,
+                                          latency_jitter=args.latency / 2, error_rate=args.error_rate,
+                                          token_ttl=args.token_ttl))
+    base_url = await standin.start()
+    registry = async_get_client_registry(hass)
+    clients = []
+    coordinators = []
+    try:
+        for index in range(entry_count):
+            # entries are spread over accounts like on a multi-account install
+            config = {CONF_USERNAME: f"bench-{device_count}-{index % args.accounts}@example.com",
+                      CONF_PASSWORD: "bench"}
+            client = registry.acquire(config)
+            client.base_url = base_url
+            clients.append(config[CONF_USERNAME])
+            coordinators.append(OBSCoordinator(hass, client, {}, entry_id=f"bench-{device_count}-{index}"))
+
+        latencies = []
+        requests = []
+        for _ in range(args.refreshes):
+            before = standin.total_requests
+            start = time.perf_counter()
+            await asyncio.gather(*(coordinator.async_refresh() for coordinator in coordinators))
+            latencies.append(time.perf_counter() - start)
+            requests.append(standin.total_requests - before)
+            standin.consume(1024)
+
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        await coordinators[0].async_refresh()
+        retained = dict(coordinators[0].data)
+        snapshot_after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        retained_bytes = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, "filename"))
+        del retained
+
+        coordinator = coordinators[0]
+        entities = [entity for obs_full_data in coordinator.data.values()
+                    for entity in build_device_entities(coordinator, obs_full_data, SENSOR_DESCRIPTIONS)]
+        # entities are added through a platform like in Home Assistant, they subscribe to the coordinator
+        component = EntityComponent(_LOGGER, SENSOR_DOMAIN, hass)
+        await component.async_add_entities(entities)
+        # snapshots of two consumptions alternated so every dispatch carries changed values to write
+        snapshot_sets = [
+            {device_id: DeviceSnapshot.from_full_data(replace(obs_full_data, consumption=replace(
+                obs_full_data.consumption, left_data=max(0, obs_full_data.consumption.left_data - used_kb))))
+             for device_id, obs_full_data in coordinator.data.items()}
+            for used_kb in (1024, 2048)]
+        writes = _WriteCounter(hass)
+        start = time.perf_counter()
+        for index in range(args.refreshes):
+            coordinator.snapshots = snapshot_sets[index % 2]
+            coordinator.async_update_listeners()
+        dispatch_time = time.perf_counter() - start
+        # the state changed events are delivered once the loop runs
+        await hass.async_block_till_done()
+        writes.cancel()
+        for entity in entities:
+            await entity.async_remove()
+
+        return {
+            "devices": device_count,
+            "entries": entry_count,
+            "refresh_p50_ms": statistics.median(latencies) * 1000,
+            "refresh_max_ms": max(latencies) * 1000,
+            "requests_per_refresh": statistics.mean(requests),
+            "bytes_per_device": retained_bytes / max(device_count, 1),
+            "entity_updates_per_s": writes.count / dispatch_time if dispatch_time else 0,
+            "errors": sum(count for status, count in standin.status_counts.items() if status >= 400),
+        }
+    finally:
+        for username in clients:
+            await registry.async_release(username)
+        await standin.stop()
+
+
+async def _run(args) -> list[dict]:
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        # the entities added by the throughput benchmark are registered like in Home Assistant
+        entity_helper.async_setup(hass)
+        await dr.async_load(hass)
+        await er.async_load(hass)
+        try:
+            return [await _bench_case(hass, device_count, entry_count, args)
+                    for device_count in args.devices for entry_count in args.entries]
+        finally:
+            await hass.async_stop(force=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--entries", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--accounts", type=int, default=1, help="number of accounts the entries are spread over")
+    parser.add_argument("--refreshes", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args))
+    columns = list(results[0].keys())
+    print(" | ".join(f"{column:>20}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{result[column]:>20.1f}" if isinstance(result[column], float)
+                         else f"{result[column]:>20}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
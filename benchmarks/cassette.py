@@ -0,0 +1,93 @@
+"""Record the OBS API calls of a refresh to a cassette, or profile refreshes replayed from one.
+
+record runs one refresh of the coordinator against the live API (or --base-url) and writes the
+calls to the cassette, with credentials, tokens and personal fields redacted. replay runs
+refreshes against the cassette, without network access, and prints their timings.
+
+Requires homeassistant to be installed, run from the repository root:
+
+    python -m benchmarks.cassette record --username me@example.com --password secret obs.json
+    python -m benchmarks.cassette replay obs.json --refreshes 20 --latency 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.orange_internet_on_the_move.client_registry import async_get_client_registry
+from custom_components.orange_internet_on_the_move.const import BASE_URL, CONF_USERNAME, CONF_PASSWORD
+from custom_components.orange_internet_on_the_move.sensor import OBSCoordinator
+from custom_components.orange_internet_on_the_move.transport import (
+    AiohttpTransport, RecordingTransport, ReplayTransport,
+)
+
+
+async def _record(hass: HomeAssistant, args) -> None:
+    registry = async_get_client_registry(hass)
+    registry.transport = RecordingTransport(AiohttpTransport(lambda: registry.session), args.cassette)
+    config = {CONF_USERNAME: args.username, CONF_PASSWORD: args.password}
+    client = registry.acquire(config)
+    client.base_url = args.base_url
+    try:
+        coordinator = OBSCoordinator(hass, client, {}, "record")
+        await coordinator.async_refresh()
+        if not coordinator.last_update_success:
+            raise SystemExit(f"Refresh failed: {coordinator.last_exception}")
+        print(f"Recorded {client.metrics.request_count} calls of {len(coordinator.data)} device(s) "
+              f"to {args.cassette}")
+    finally:
+        await registry.async_release(args.username)
+
+
+async def _replay(hass: HomeAssistant, args) -> None:
+    registry = async_get_client_registry(hass)
+    registry.transport = ReplayTransport.from_file(args.cassette, args.latency)
+    config = {CONF_USERNAME: "replay@example.com", CONF_PASSWORD: "replay"}
+    client = registry.acquire(config)
+    try:
+        coordinator = OBSCoordinator(hass, client, {}, "replay")
+        latencies = []
+        for _ in range(args.refreshes):
+            # every refresh goes through the whole pipeline instead of the client caches
+            client.invalidate_cache()
+            start = time.perf_counter()
+            await coordinator.async_refresh()
+            latencies.append(time.perf_counter() - start)
+            if not coordinator.last_update_success:
+                raise SystemExit(f"Refresh failed: {coordinator.last_exception}")
+        print(f"devices: {len(coordinator.data)}, refreshes: {args.refreshes}")
+        print(f"refresh p50: {statistics.median(latencies) * 1000:.1f} ms, max: {max(latencies) * 1000:.1f} ms")
+        print(f"last refresh phases: {coordinator.refresh_metrics.as_dict()['last_phases_seconds']}")
+    finally:
+        await registry.async_release(config[CONF_USERNAME])
+
+
+async def _run(args) -> None:
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            await (_record(hass, args) if args.command == "record" else _replay(hass, args))
+        finally:
+            await hass.async_stop(force=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record")
+    record.add_argument("cassette")
+    record.add_argument("--username", required=True)
+    record.add_argument("--password", required=True)
+    record.add_argument("--base-url", default=BASE_URL)
+    replay = commands.add_parser("replay")
+    replay.add_argument("cassette")
+    replay.add_argument("--refreshes", type=int, default=10)
+    replay.add_argument("--latency", type=float, default=0.0, help="seconds added to every replayed call")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
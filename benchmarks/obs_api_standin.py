@@ -0,0 +1,198 @@
+"""In process stand-in of the OBS API, to exercise the client and the coordinator offline.
+
+Implements the login, user, devices, consumption and subscription endpoints with configurable
+device count, latency, error rate, token lifetime (401 once expired) and throttling (429 with
+Retry-After). Can be run on its own:
+
+    python -m benchmarks.obs_api_standin --devices 20 --latency 0.05 --port 8080
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from custom_components.orange_internet_on_the_move.const import (
+    ENDPOINT_LOGIN, ENDPOINT_USER, ENDPOINT_DEVICES, ENDPOINT_DEVICE_CONSUMPTION, ENDPOINT_DEVICE_SUBSCRIPTION,
+)
+
+GIGABYTE_IN_KB = 1024 * 1024
+
+
+@dataclass
+class StandinConfig:
+    devices: int = 1
+    # seconds added to every response, with +/- latency_jitter
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # ratio of data requests answered with a 500
+    error_rate: float = 0.0
+    # lifetime of the issued tokens in seconds, None for tokens that never expire
+    token_ttl: float | None = None
+    # maximum requests per second before answering 429, None to disable throttling
+    max_requests_per_second: float | None = None
+    retry_after: int = 1
+    seed: int = 0
+
+
+class ObsApiStandin:
+    def __init__(self, config: StandinConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.request_counts: Counter[str] = Counter()
+        self.status_counts: Counter[int] = Counter()
+        self._tokens: dict[str, float] = {}
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        now = datetime.now(timezone.utc)
+        self.devices = [self._device(index, now) for index in range(config.devices)]
+        self.consumptions = {device["id"]: self._consumption(now) for device in self.devices}
+        self._runner: web.AppRunner | None = None
+        self.base_url: str | None = None
+
+    def _device(self, index: int, now: datetime) -> dict:
+        device_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+        return {
+            "id": device_id,
+            "country": "FR",
+            "status": "ACTIVE",
+            "tag": f"Car {index}",
+            "user": {"id": f"user-{index}", "name": "Standin User", "email": "user@example.com"},
+            "notification": {"email": True, "sms": False, "threshold": [50, 80, 100]},
+            "puk": "12345678",
+            "serial_number": f"SN{index:08d}",
+            "creation_date": (now - timedelta(days=365)).isoformat(),
+        }
+
+    def _consumption(self, now: datetime) -> list[dict]:
+        initial_data = 20 * GIGABYTE_IN_KB
+        return [{
+            "type": "onetime",
+            "initial_data": initial_data,
+            "left_data": self.random.randint(0, initial_data),
+            "start_date": (now - timedelta(days=10)).isoformat(),
+            "expiry_date": (now + timedelta(days=20)).isoformat(),
+        }]
+
+    def consume(self, amount_kb: int) -> None:
+        """Simulate usage on every device"""
+        for consumption in self.consumptions.values():
+            consumption[0]["left_data"] = max(0, consumption[0]["left_data"] - amount_kb)
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.request_counts.values())
+
+    async def _delay(self) -> None:
+        delay = self.config.latency + self.random.uniform(-self.config.latency_jitter, self.config.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _throttled(self) -> bool:
+        if self.config.max_requests_per_second is None:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count > self.config.max_requests_per_second
+
+    def _token_valid(self, request: web.Request) -> bool:
+        issued_at = self._tokens.get(request.headers.get("x-auth-token", ""))
+        if issued_at is None:
+            return False
+        return self.config.token_ttl is None or time.monotonic() - issued_at < self.config.token_ttl
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        self.request_counts[resource.canonical if resource is not None else request.path] += 1
+        await self._delay()
+        if self._throttled():
+            response = web.json_response({"error": "throttled"}, status=429,
+                                         headers={"Retry-After": str(self.config.retry_after)})
+        elif request.path != ENDPOINT_LOGIN and not self._token_valid(request):
+            response = web.json_response({"error": "unauthorized"}, status=401)
+        elif request.path != ENDPOINT_LOGIN and self.random.random() < self.config.error_rate:
+            response = web.json_response({"error": "internal"}, status=500)
+        else:
+            response = await handler(request)
+        self.status_counts[response.status] += 1
+        return response
+
+    async def _login(self, request: web.Request) -> web.Response:
+        if not request.headers.get("Authorization", "").startswith("Basic "):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        token = uuid.uuid4().hex
+        self._tokens[token] = time.monotonic()
+        return web.json_response({}, headers={"x-auth-token": token})
+
+    async def _user(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": "user-0", "email": "user@example.com", "role": "USER",
+                                  "firstname": "Standin", "lastname": "User", "type": "B2C", "enabled": True,
+                                  "creation_date": self.devices[0]["creation_date"] if self.devices else None})
+
+    async def _devices(self, request: web.Request) -> web.Response:
+        return web.json_response(self.devices)
+
+    async def _device_consumption(self, request: web.Request) -> web.Response:
+        consumption = self.consumptions.get(request.match_info["device_id"])
+        if consumption is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(consumption)
+
+    async def _device_subscription(self, request: web.Request) -> web.Response:
+        consumption = self.consumptions.get(request.match_info["device_id"])
+        if consumption is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response({"name": "Standin plan", "status": "ACTIVE",
+                                  "start_date": consumption[0]["start_date"],
+                                  "expiry_date": consumption[0]["expiry_date"]})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post(ENDPOINT_LOGIN, self._login)
+        app.router.add_get(ENDPOINT_USER, self._user)
+        app.router.add_get(ENDPOINT_DEVICES, self._devices)
+        app.router.add_get(ENDPOINT_DEVICES + "/{device_id}" + ENDPOINT_DEVICE_CONSUMPTION, self._device_consumption)
+        app.router.add_get(ENDPOINT_DEVICES + "/{device_id}" + ENDPOINT_DEVICE_SUBSCRIPTION, self._device_subscription)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    parser.add_argument("--max-requests-per-second", type=float, default=None)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    standin = ObsApiStandin(StandinConfig(devices=args.devices, latency=args.latency, error_rate=args.error_rate,
+                                          token_ttl=args.token_ttl,
+                                          max_requests_per_second=args.max_requests_per_second))
+    web.run_app(standin.make_app(), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,316 @@
-import logging
+import asyncio
+import base64
+import contextlib
+import json
+import time
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime, timedelta
+from typing import Any
+from urllib.parse import urlparse
 
 import aiohttp
 import voluptuous as vol
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
 
+from .global_scheduler import GlobalPollScheduler
+from .log import get_logger, register_secret, unregister_secret
+from .metrics import ApiMetrics, endpoint_label
+from .resilience import CIRCUIT_HALF_OPEN, CircuitBreaker, RetryPolicy, TokenBucket, parse_retry_after
+from .single_flight import SingleFlight
+from .transport import AiohttpTransport, Transport, TransportResponse
 from .const import (
     CONF_USERNAME, CONF_PASSWORD, BASE_URL, ENDPOINT_USER, ENDPOINT_HEADER_PROVIDER,
     ENDPOINT_HEADER_APPLICATION, ENDPOINT_LOGIN, ENDPOINT_DEVICES, ENDPOINT_DEVICE_CONSUMPTION,
+    ENDPOINT_DEVICE_SUBSCRIPTION, DEVICES_CACHE_TTL_SECONDS, SUBSCRIPTION_CACHE_TTL_SECONDS,
+    STORAGE_VERSION, STORAGE_KEY_TOKEN, TOKEN_EXPIRY_MARGIN_SECONDS, REQUEST_TIMEOUT_SECONDS,
+    SINGLE_FLIGHT_FRESHNESS_SECONDS, SERVICE_REFRESH_BURST, SERVICE_REFRESH_TOKENS_PER_HOUR, MAX_RESPONSE_BYTES,
+    STREAM_CHUNK_BYTES, STREAM_DRAIN_MAX_BYTES,
 )
-from .dto import ConsumptionOfDevice, Device
+from .decoder import (
+    CONSUMPTION_SCHEMA, DEVICE_SCHEMA, consumption_from_item, decode_stream, decode_subscriptions, device_from_item,
+)
+from .dto import ConsumptionOfDevice, Device, SubscriptionOfDevice
 
 DATA_SCHEMA = {
     vol.Required(CONF_USERNAME): str,
     vol.Required(CONF_PASSWORD): str,
 }
 
-_LOGGER = logging.getLogger(__name__)
+_LOGGER = get_logger(__name__)
 
 
 class ApiAuthError(BaseException):
     pass
 
 
+class ApiError(Exception):
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TransientApiError(ApiError):
+    """Error worth retrying: 5xx, 429, timeout or connection failure"""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ApiError):
+    pass
+
+
 class ObsHttpClient:
-    def __init__(self, hass, config):
+    def __init__(self, hass, config, transport: Transport | None = None, base_url: str = BASE_URL,
+                 global_scheduler: GlobalPollScheduler | None = None):
         self.hass = hass
         self.config = config
+        self.transport = transport if transport is not None else AiohttpTransport(
+            lambda: async_get_clientsession(hass))
+        self.global_scheduler = global_scheduler
+        self.base_url = base_url
+        self.auth_token = None
+        self.token_issued_at: datetime | None = None
+        self.token_expires_at: datetime | None = None
+        self._token_store = Store(hass, STORAGE_VERSION, STORAGE_KEY_TOKEN.format(slugify(config[CONF_USERNAME])))
+        self._token_loaded = False
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = CircuitBreaker()
+        self._single_flight = SingleFlight(SINGLE_FLIGHT_FRESHNESS_SECONDS)
+        # on demand refreshes of the account (refresh service)
+        self.refresh_bucket = TokenBucket(SERVICE_REFRESH_BURST, SERVICE_REFRESH_TOKENS_PER_HOUR / 3600)
+        self.metrics = ApiMetrics()
+        # the password is redacted from the logs once a login validated it
+        self._registered_password: str | None = None
+        _LOGGER.debug("ObsHttpClient config is %s", config)
+
+    def is_token_valid(self) -> bool:
+        if self.auth_token is None:
+            return False
+        if self.token_expires_at is None:
+            # no expiry known, the token is kept until the API rejects it
+            return True
+        return dt_util.utcnow() < self.token_expires_at - timedelta(seconds=TOKEN_EXPIRY_MARGIN_SECONDS)
+
+    def update_credentials(self, validated: "ObsHttpClient") -> None:
+        """Password of validated and its token (already stored) adopted in place, e.g. after a reauth"""
+        self.config = {**self.config, CONF_PASSWORD: validated.config[CONF_PASSWORD]}
+        self._register_password()
+        self.invalidate_token()
+        self.auth_token = validated.auth_token
+        register_secret(self.auth_token)
+        self.token_issued_at = validated.token_issued_at
+        self.token_expires_at = validated.token_expires_at
+        self._token_loaded = True
+
+    def _register_password(self) -> None:
+        if self._registered_password != self.config[CONF_PASSWORD]:
+            unregister_secret(self._registered_password)
+            self._registered_password = self.config[CONF_PASSWORD]
+            register_secret(self._registered_password)
+
+    def forget_secrets(self) -> None:
+        """Stops redacting the password and token of the client, once it is no longer used"""
+        unregister_secret(self._registered_password)
+        self._registered_password = None
+        unregister_secret(self.auth_token)
+
+    def invalidate_token(self) -> None:
+        unregister_secret(self.auth_token)
         self.auth_token = None
-        _LOGGER.debug(f"ObsHttpClient config is {config}")
+        self.token_issued_at = None
+        self.token_expires_at = None
+
+    async def async_ensure_token(self) -> None:
+        """Reuse the cached token (in memory or from storage), log in only when none is valid"""
+        if not self._token_loaded:
+            await self._async_load_token()
+        if self.is_token_valid():
+            return
+        _LOGGER.debug("No valid token available, logging in")
+        await self.authenticate_and_store_token()
+
+    async def _async_load_token(self) -> None:
+        self._token_loaded = True
+        stored = await self._token_store.async_load()
+        if not stored or self.auth_token is not None:
+            return
+        self.auth_token = stored.get("token")
+        register_secret(self.auth_token)
+        self.token_issued_at = dt_util.parse_datetime(stored["issued_at"]) if stored.get("issued_at") else None
+        self.token_expires_at = dt_util.parse_datetime(stored["expires_at"]) if stored.get("expires_at") else None
+        _LOGGER.debug("Restored token from storage, issued at %s, expires at %s", self.token_issued_at,
+                      self.token_expires_at)
+
+    async def _async_save_token(self) -> None:
+        await self._token_store.async_save({
+            "token": self.auth_token,
+            "issued_at": self.token_issued_at.isoformat() if self.token_issued_at else None,
+            "expires_at": self.token_expires_at.isoformat() if self.token_expires_at else None,
+        })
+
+    async def async_remove_token(self) -> None:
+        self.invalidate_token()
+        await self._token_store.async_remove()
+
+    @staticmethod
+    def _extract_token_expiry(token: str, headers) -> datetime | None:
+        """Token expiry from response headers or, for a JWT, from its exp claim"""
+        expires_header = headers.get("x-auth-token-expires")
+        if expires_header:
+            parsed = dt_util.parse_datetime(expires_header)
+            if parsed is not None:
+                return dt_util.as_utc(parsed)
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        try:
+            payload = parts[1] + "=" * (-len(parts[1]) % 4)
+            claims = json.loads(base64.urlsafe_b64decode(payload))
+            return dt_util.utc_from_timestamp(int(claims["exp"]))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    async def _request_once(self, method: str, url: str, headers: dict, stream: bool = False) -> TransportResponse:
+        """Single call with a deadline covering the body, transient failures raise TransientApiError.
+
+        With stream, the body of a successful response is left unread for the caller, who releases it.
+        """
+        endpoint = endpoint_label(method, url)
+        status = None
+        async with self._request_slot():
+            start = time.monotonic()
+            try:
+                async with asyncio.timeout(REQUEST_TIMEOUT_SECONDS):
+                    response = await self.transport.request(method, url, headers)
+                    status = response.status
+                    if response.content_length is not None and response.content_length > MAX_RESPONSE_BYTES:
+                        response.close()
+                        raise ApiError(f"{method} {url} returned {response.content_length} bytes", response.status)
+                    if not stream or response.status != 200:
+                        body = await response.read()
+                        self.metrics.record_payload(endpoint, len(body))
+                        if len(body) > MAX_RESPONSE_BYTES:
+                            raise ApiError(f"{method} {url} returned {len(body)} bytes", response.status)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as err:
+                raise TransientApiError(f"{method} {url} failed: {err!r}") from err
+            finally:
+                # time to the headers only for a streamed response
+                self.metrics.record_request(endpoint, time.monotonic() - start, status)
+        _LOGGER.debug("Status: %s", response.status)
+        if response.status == 429 or response.status >= 500:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status == 429 and self.global_scheduler is not None:
+                self.global_scheduler.throttle(retry_after)
+            raise TransientApiError(f"{method} {url} returned {response.status}", retry_after)
+        return response
+
+    def _request_slot(self):
+        if self.global_scheduler is None:
+            return contextlib.nullcontext()
+        return self.global_scheduler.request_slot()
+
+    async def _request(self, method: str, url: str, headers: dict, stream: bool = False) -> TransportResponse:
+        """Call retried with backoff on transient failures, guarded by the circuit breaker"""
+        if not self.circuit_breaker.allow_request():
+            if self.circuit_breaker.state == CIRCUIT_HALF_OPEN:
+                raise CircuitOpenError("OBS API calls suspended until the trial call in flight succeeds")
+            raise CircuitOpenError(
+                f"OBS API calls suspended for {self.circuit_breaker.remaining_cool_down:.0f} seconds")
+        attempt = 0
+        while True:
+            try:
+                response = await self._request_once(method, url, headers, stream)
+            except TransientApiError as err:
+                delay = self.retry_policy.delay(attempt, err.retry_after)
+                if delay is None:
+                    self.circuit_breaker.record_failure()
+                    raise
+                _LOGGER.debug("Transient error %s, retry in %.1f seconds", err, delay)
+                self.metrics.retries += 1
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            return response
+
+    async def _authenticated_get(self, url: str, stream: bool = False, relogin: bool = True) -> TransportResponse:
+        """GET with the cached token, logging in again and retrying once if the token is rejected.
+
+        relogin=False is for optional endpoints, whose 401/403 raises ApiError and keeps the token.
+        """
+        await self.async_ensure_token()
+        rejected_token = self.auth_token
+        response = await self._request("GET", url, self.get_additional_header(), stream)
+        if response.status in (401, 403) and relogin:
+            self.metrics.token_rejections += 1
+            if self.auth_token == rejected_token:
+                _LOGGER.debug("Token rejected with status %s, logging in again", response.status)
+                self.invalidate_token()
+                await self.authenticate_and_store_token()
+            else:
+                # another caller already replaced the rejected token
+                await self.async_ensure_token()
+            response = await self._request("GET", url, self.get_additional_header(), stream)
+            _LOGGER.debug("Status after new login: %s", response.status)
+            if response.status in (401, 403):
+                raise ApiAuthError
+        if response.status != 200:
+            raise ApiError(f"GET {url} returned {response.status}", response.status)
+        return response
+
+    async def _stream_items(self, url: str, schema: vol.Schema, factory: Callable[[dict], Any]) -> AsyncIterator[Any]:
+        """Items of a list endpoint, decoded one at a time while the body is read"""
+        response = await self._authenticated_get(url, stream=True)
+        endpoint = endpoint_label("GET", url)
+        size = 0
+
+        async def counted_chunks() -> AsyncIterator[bytes]:
+            nonlocal size
+            async for chunk in response.iter_chunked(STREAM_CHUNK_BYTES):
+                size += len(chunk)
+                yield chunk
+
+        try:
+            async for item in decode_stream(counted_chunks(), schema, factory, MAX_RESPONSE_BYTES):
+                yield item
+        except GeneratorExit:
+            # the caller stopped early (e.g. first item only), a small rest is read to reuse the connection
+            size += await self._drain(response, size)
+            raise
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as err:
+            raise TransientApiError(f"GET {url} failed: {err!r}") from err
+        except (vol.Invalid, ValueError) as err:
+            raise ApiError(f"GET {url} returned an invalid payload: {err}") from err
+        finally:
+            self.metrics.record_payload(endpoint, size)
+            # the connection is closed rather than reused when the body was not read to the end
+            response.release()
+
+    @staticmethod
+    async def _drain(response: TransportResponse, read: int) -> int:
+        """Reads the rest of the body when at most STREAM_DRAIN_MAX_BYTES, returns the bytes read"""
+        if response.content_length is not None and response.content_length - read > STREAM_DRAIN_MAX_BYTES:
+            return 0
+        drained = 0
+        try:
+            async with asyncio.timeout(REQUEST_TIMEOUT_SECONDS):
+                async for chunk in response.iter_chunked(STREAM_CHUNK_BYTES):
+                    drained += len(chunk)
+                    if drained > STREAM_DRAIN_MAX_BYTES:
+                        break
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as err:
+            _LOGGER.debug("Unread body not drained: %r", err)
+        return drained
 
     async def authenticate_and_store_token(self) -> None:
+        """Log in, concurrent callers share the same login"""
+        await self._single_flight.run("login", self._login, fresh=False)
+
+    async def _login(self) -> None:
         basic_authorization = aiohttp.helpers.BasicAuth(self.config[CONF_USERNAME], self.config[CONF_PASSWORD])
         authorization_encoded = basic_authorization.encode()
         additional_headers = {
@@ -38,28 +319,30 @@ class ObsHttpClient:
             "Authorization": authorization_encoded
         }
 
-        _LOGGER.debug(f"authenticate_and_store_token with {additional_headers} and {basic_authorization}")
-        endpoint_login = BASE_URL + ENDPOINT_LOGIN
-        _LOGGER.debug(f"authenticate_and_store_token on {endpoint_login}")
+        endpoint_login = self._url(ENDPOINT_LOGIN)
+        _LOGGER.debug("authenticate_and_store_token on %s", endpoint_login)
 
-        session = async_get_clientsession(self.hass)
-        response = await session.post(endpoint_login, headers=additional_headers)
-        _LOGGER.debug(f"Status: {response.status}")
+        self.metrics.logins += 1
+        response = await self._request("POST", endpoint_login, additional_headers)
         if response.status != 200:
             raise ApiAuthError
-        _LOGGER.debug("x-auth-token:", response.headers['x-auth-token'])
 
+        unregister_secret(self.auth_token)
         self.auth_token = response.headers['x-auth-token']
-        _LOGGER.debug(f"Fetched a token from OBS auth : {self.auth_token}")
+        register_secret(self.auth_token)
+        self._register_password()
+        self.token_issued_at = dt_util.utcnow()
+        self.token_expires_at = self._extract_token_expiry(self.auth_token, response.headers)
+        self._token_loaded = True
+        _LOGGER.debug("Fetched a token from OBS auth, expires at %s", self.token_expires_at)
+        await self._async_save_token()
 
     # not used
     async def get_user_info(self):
-        _LOGGER.debug(f"get_user_info called")
-        session = async_get_clientsession(self.hass)
-        response = await session.get(BASE_URL + ENDPOINT_USER, headers=self.get_additional_header())
-        _LOGGER.debug("Status:", response.status)
+        _LOGGER.debug("get_user_info called")
+        response = await self._authenticated_get(self._url(ENDPOINT_USER))
         user_info_response = await response.json()
-        _LOGGER.debug(f"Fetched user info {user_info_response}")
+        _LOGGER.debug("Fetched user info %s", user_info_response)
 
         return user_info_response
 
@@ -72,6 +355,10 @@ class ObsHttpClient:
     #     enabled: str
     #     creation_date: str
 
+    def _url(self, *path: str) -> str:
+        """URL on base_url of the path segments, e.g. ENDPOINT_DEVICES, a device id and ENDPOINT_DEVICE_CONSUMPTION"""
+        return self.base_url.rstrip("/") + "/" + "/".join(segment.strip("/") for segment in path)
+
     def get_additional_header(self):
         return {
             "x-application": ENDPOINT_HEADER_APPLICATION,
@@ -79,30 +366,38 @@ class ObsHttpClient:
             "x-auth-token": self.auth_token,
             "Accept": "application/json",
             "Content-Type": "application/json",
-            "Host": "internetonthemove.orange-business.com",
+            "Host": urlparse(self.base_url).netloc,
         }
 
-    async def get_first_device_info(self) -> Device:
-        _LOGGER.debug(f"get_devices_info called with auth token {self.auth_token}")
-
-        endpoint_devices = BASE_URL + ENDPOINT_DEVICES
-        _LOGGER.debug(f"calling endpoint {endpoint_devices}")
-        session = async_get_clientsession(self.hass)
-        response = await session.get(endpoint_devices, headers=self.get_additional_header())
-        _LOGGER.debug("Status:", response.status)
-        device_info_response = await response.json()
-        _LOGGER.debug(f"Fetched user info {device_info_response}")
-        first_device_response = device_info_response[0]
-        _LOGGER.debug(f"Select first object device {first_device_response}")
-        return Device(first_device_response["id"],
-                      first_device_response["country"],
-                      first_device_response["status"],
-                      first_device_response["tag"],
-                      first_device_response["user"]["id"],
-                      first_device_response["user"]["name"],
-                      first_device_response["creation_date"],
-                      first_device_response["serial_number"]
-                      )
+    async def get_devices_info(self, force_refresh: bool = False) -> list[Device]:
+        """Devices of the account, cached for DEVICES_CACHE_TTL_SECONDS as they hardly ever change"""
+        return await self._single_flight.run("devices", self._fetch_devices_info, fresh=not force_refresh,
+                                             ttl=DEVICES_CACHE_TTL_SECONDS)
+
+    def async_iter_devices(self, force_refresh: bool = False) -> AsyncIterator[Device]:
+        """Devices of the account, yielded as soon as they are decoded when the list is not cached.
+
+        Concurrent refreshes share one call, which also serves get_devices_info.
+        """
+        return self._single_flight.stream("devices", self._stream_devices, fresh=not force_refresh,
+                                          ttl=DEVICES_CACHE_TTL_SECONDS)
+
+    def invalidate_devices(self) -> None:
+        self._single_flight.forget("devices")
+
+    def invalidate_cache(self) -> None:
+        """Forget every cached response, the next calls reach the API"""
+        self._single_flight.forget()
+
+    async def _fetch_devices_info(self) -> list[Device]:
+        _LOGGER.debug("get_devices_info called")
+        async with contextlib.aclosing(self._stream_devices()) as streamed:
+            return [device async for device in streamed]
+
+    def _stream_devices(self) -> AsyncIterator[Device]:
+        endpoint_devices = self._url(ENDPOINT_DEVICES)
+        _LOGGER.debug("calling endpoint %s", endpoint_devices)
+        return self._stream_items(endpoint_devices, DEVICE_SCHEMA, device_from_item)
 
     # id
     # country
@@ -115,25 +410,61 @@ class ObsHttpClient:
     # creation_date
 
     async def get_consumption_of_device(self, device: Device) -> ConsumptionOfDevice:
-        _LOGGER.debug(f"get_consumption_of_device called")
-        consumption_endpoint = BASE_URL + ENDPOINT_DEVICES + "/" + device.device_id + ENDPOINT_DEVICE_CONSUMPTION
-        _LOGGER.debug(f"Calling endpoint {consumption_endpoint}")
-        session = async_get_clientsession(self.hass)
-        response = await session.get(consumption_endpoint, headers=self.get_additional_header())
-        _LOGGER.debug("Status:", response.status)
-        device_consumption_response = await response.json()
-        _LOGGER.debug(f"Fetched consumption {device_consumption_response}")
-        first_device = device_consumption_response[0]
-        _LOGGER.debug(f"Select first object device consumption {first_device}")
-        return ConsumptionOfDevice(first_device["type"],
-                                   first_device["initial_data"],
-                                   first_device["left_data"],
-                                   first_device["expiry_date"],
-                                   first_device["start_date"],
-                                   )
+        """Current plan of the device, the first entry returned by the consumption endpoint"""
+        return await self._single_flight.run(("consumption", device.device_id),
+                                             lambda: self._fetch_consumption_of_device(device))
+
+    async def _fetch_consumption_of_device(self, device: Device) -> ConsumptionOfDevice:
+        _LOGGER.debug("get_consumption_of_device called for %s", device.device_id)
+        consumption_endpoint = self._url(ENDPOINT_DEVICES, device.device_id, ENDPOINT_DEVICE_CONSUMPTION)
+        _LOGGER.debug("Calling endpoint %s", consumption_endpoint)
+        async with contextlib.aclosing(self._stream_items(consumption_endpoint, CONSUMPTION_SCHEMA,
+                                                          consumption_from_item)) as consumptions:
+            async for consumption in consumptions:
+                # the rest of the body (older plans) is not decoded
+                _LOGGER.debug("Select first object device consumption %s", consumption)
+                return consumption
+        raise ApiError(f"No valid consumption returned for device {device.device_id}")
 
         # type
         # initial_data
         # left_data
         # expiry_date
         # start_date
+
+    async def get_subscription_of_device(self, device: Device) -> SubscriptionOfDevice | None:
+        """Subscription of the device, cached for SUBSCRIPTION_CACHE_TTL_SECONDS.
+
+        The subscription is optional: a failure, a rejected token included, raises ApiError and is
+        cached as long as a result, so the endpoint is not called again on every refresh.
+        """
+        failure_key = ("subscription_failure", device.device_id)
+        failure = self._single_flight.cached(failure_key, SUBSCRIPTION_CACHE_TTL_SECONDS)
+        if failure is not None:
+            raise ApiError(f"subscription unavailable: {failure}", failure.status)
+        try:
+            return await self._single_flight.run(("subscription", device.device_id),
+                                                 lambda: self._fetch_subscription_of_device(device),
+                                                 ttl=SUBSCRIPTION_CACHE_TTL_SECONDS)
+        except CircuitOpenError:
+            # the whole API is suspended, not this endpoint
+            raise
+        except ApiError as err:
+            self._single_flight.remember(failure_key, err)
+            raise
+
+    async def _fetch_subscription_of_device(self, device: Device) -> SubscriptionOfDevice | None:
+        _LOGGER.debug("get_subscription_of_device called for %s", device.device_id)
+        subscription_endpoint = self._url(ENDPOINT_DEVICES, device.device_id, ENDPOINT_DEVICE_SUBSCRIPTION)
+        # a 401/403 of the subscription alone does not mean the token is invalid
+        response = await self._authenticated_get(subscription_endpoint, relogin=False)
+        try:
+            device_subscription_response = await response.json()
+        except (ValueError, aiohttp.ContentTypeError) as err:
+            raise ApiError(f"GET {subscription_endpoint} returned an invalid payload: {err}") from err
+        _LOGGER.debug("Fetched subscription %s", device_subscription_response)
+        try:
+            subscriptions = decode_subscriptions(device_subscription_response)
+        except vol.Invalid as err:
+            raise ApiError(f"GET {subscription_endpoint} returned an invalid payload: {err}") from err
+        return subscriptions[0] if subscriptions else None
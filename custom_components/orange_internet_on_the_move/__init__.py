@@ -1,37 +1,59 @@
-import logging
-
 import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.typing import ConfigType
 
+from .log import get_logger
 from .OBSHttpClient import ObsHttpClient
+from .client_registry import async_get_client_registry
+from .history import ConsumptionHistoryStore
+from .long_term_statistics import ConsumptionStatistics
+from .last_data import LastDataStore
+from .services import async_setup_services
+from .thresholds import ThresholdMonitor
 from .const import (
-    DOMAIN, CONF_USERNAME, CONF_PASSWORD, )
+    DOMAIN, CONF_USERNAME, CONF_PASSWORD, DATA_APPLIED_OPTIONS, )
 
 DATA_SCHEMA = {
     vol.Required(CONF_USERNAME): str,
     vol.Required(CONF_PASSWORD): str,
 }
 
-_LOGGER = logging.getLogger(__name__)
+_LOGGER = get_logger(__name__)
+
+
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    async_setup_services(hass)
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    _LOGGER.info("Called async setup entry from __init__.py")
-    _LOGGER.debug(f"Async setup entry with config data {entry.data}")
+    _LOGGER.debug("Called async setup entry from __init__.py")
+    _LOGGER.debug("Async setup entry with config data %s", entry.data)
 
-    hass.data.setdefault(DOMAIN, {})
+    # entries of the same account share one client (token and connection pool)
+    client_registry = async_get_client_registry(hass)
 
-    # here we store the coordinator for future access
-    if entry.entry_id not in hass.data[DOMAIN]:
-        hass.data[DOMAIN][entry.entry_id] = {}
-    hass.data[DOMAIN][entry.entry_id] = ObsHttpClient(config=dict(entry.data), hass=hass)
+    # here we store the client for future access
+    hass.data[DOMAIN][entry.entry_id] = client_registry.acquire(dict(entry.data))
 
     # will make sure async_setup_entry from sensor.py is called
     await hass.config_entries.async_forward_entry_setups(entry, [Platform.SENSOR])
 
     # subscribe to config updates
+    applied_options = hass.data[DOMAIN].setdefault(DATA_APPLIED_OPTIONS, {})
+    applied_options[entry.entry_id] = dict(entry.options)
+
+    @callback
+    def forget_applied_options() -> None:
+        applied_options.pop(entry.entry_id, None)
+
+    entry.async_on_unload(forget_applied_options)
     entry.async_on_unload(entry.add_update_listener(update_entry))
 
     return True
@@ -43,6 +65,9 @@ async def update_entry(hass, entry):
     We trigger the reloading of entry (that will eventually call async_unload_entry)
     """
     _LOGGER.debug("update_entry method called")
+    if entry.options == hass.data[DOMAIN].get(DATA_APPLIED_OPTIONS, {}).get(entry.entry_id):
+        # only the credentials changed (reauth), they are swapped in place on the client
+        return
     # will make sure async_setup_entry from sensor.py is called
     await hass.config_entries.async_reload(entry.entry_id)
 
@@ -53,4 +78,18 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, [Platform.SENSOR])
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
+        await async_get_client_registry(hass).async_release(entry.data[CONF_USERNAME])
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """This method is called when the entry is deleted, the persisted token is dropped"""
+    _LOGGER.debug("async_remove_entry method called")
+    await ConsumptionHistoryStore(hass, entry.entry_id).async_remove()
+    await LastDataStore(hass, entry.entry_id).async_remove()
+    await ThresholdMonitor(hass, entry.entry_id, entry.options).async_remove()
+    await ConsumptionStatistics(hass, entry.entry_id).async_remove()
+    if async_get_client_registry(hass).has_client(entry.data[CONF_USERNAME]):
+        # the token is still used by another entry of the same account
+        return
+    await ObsHttpClient(config=dict(entry.data), hass=hass).async_remove_token()
@@ -0,0 +1,116 @@
+
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util.ssl import client_context
+
+from .global_scheduler import async_get_global_scheduler
+from .log import get_logger
+from .OBSHttpClient import ObsHttpClient
+from .transport import AiohttpTransport, Transport
+from .const import (
+    DOMAIN, CONF_USERNAME, DATA_CLIENT_REGISTRY, HTTP_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+    HTTP_DNS_CACHE_TTL_SECONDS, HTTP_TOTAL_TIMEOUT_SECONDS, HTTP_CONNECT_TIMEOUT_SECONDS,
+)
+
+_LOGGER = get_logger(__name__)
+
+
+class ObsClientRegistry:
+    """One ObsHttpClient per OBS account, shared by its config entries and reference counted.
+
+    The registry owns a dedicated aiohttp session for the OBS host, so polls reuse warm
+    connections instead of competing on the shared Home Assistant session. Setting transport
+    makes the clients created afterwards use it instead, e.g. to replay a cassette.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._clients: dict[str, ObsHttpClient] = {}
+        self._ref_counts: dict[str, int] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self.transport: Transport | None = None
+        # clients validated by a config flow, picked up by the setup of the entry created
+        self._handed_off: dict[str, ObsHttpClient] = {}
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, self._async_close_session)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=HTTP_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL_SECONDS,
+                ssl=client_context(),
+            )
+            timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            _LOGGER.debug("Created dedicated OBS http session")
+        return self._session
+
+    def has_client(self, username: str) -> bool:
+        return username in self._clients
+
+    @callback
+    def create_client(self, config: dict) -> ObsHttpClient:
+        """A client on the pooled session that is not shared, e.g. to validate credentials"""
+        transport = self.transport if self.transport is not None else AiohttpTransport(lambda: self.session)
+        return ObsHttpClient(config=config, hass=self.hass, transport=transport,
+                             global_scheduler=async_get_global_scheduler(self.hass))
+
+    @callback
+    def hand_off(self, client: ObsHttpClient) -> None:
+        """Keeps a client validated by a config flow, with its token and device list, for the entry setup"""
+        self._handed_off[client.config[CONF_USERNAME]] = client
+
+    @callback
+    def acquire(self, config: dict) -> ObsHttpClient:
+        username = config[CONF_USERNAME]
+        client = self._clients.get(username)
+        handed_off = self._handed_off.pop(username, None)
+        if client is None:
+            if handed_off is not None and handed_off.config == config:
+                _LOGGER.debug("Using the client validated by the config flow for %s", username)
+                client = handed_off
+            else:
+                client = self.create_client(config)
+            self._clients[username] = client
+            self._ref_counts[username] = 0
+        self._ref_counts[username] += 1
+        _LOGGER.debug("Acquired OBS client of %s, %s user(s)", username, self._ref_counts[username])
+        return client
+
+    @callback
+    def update_credentials(self, validated: ObsHttpClient) -> None:
+        """New password of an account, swapped in place on its client if it is in use"""
+        client = self._clients.get(validated.config[CONF_USERNAME])
+        if client is not None:
+            client.update_credentials(validated)
+        # the client in use registered the secrets it adopted
+        validated.forget_secrets()
+
+    async def async_release(self, username: str) -> None:
+        if username not in self._ref_counts:
+            return
+        self._ref_counts[username] -= 1
+        _LOGGER.debug("Released OBS client of %s, %s user(s)", username, self._ref_counts[username])
+        if self._ref_counts[username] > 0:
+            return
+        self._ref_counts.pop(username)
+        self._clients.pop(username).forget_secrets()
+        if not self._clients:
+            await self._async_close_session()
+
+    async def _async_close_session(self, _event=None) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            _LOGGER.debug("Closed dedicated OBS http session")
+        self._session = None
+
+
+@callback
+def async_get_client_registry(hass: HomeAssistant) -> ObsClientRegistry:
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_CLIENT_REGISTRY not in domain_data:
+        domain_data[DATA_CLIENT_REGISTRY] = ObsClientRegistry(hass)
+    return domain_data[DATA_CLIENT_REGISTRY]
@@ -1,12 +1,21 @@
-import logging
 
 import voluptuous as vol
 from homeassistant import config_entries
+from homeassistant.core import callback
+from homeassistant.helpers import config_validation as cv
 
-from .OBSHttpClient import ObsHttpClient, ApiAuthError
-from .const import DOMAIN, CONF_USERNAME, CONF_PASSWORD
+from .log import get_logger
+from .OBSHttpClient import ApiAuthError, ObsHttpClient
+from .client_registry import async_get_client_registry
+from .const import (
+    DOMAIN, DATA_COORDINATORS, CONF_USERNAME, CONF_PASSWORD, CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS,
+    GLOBAL_MAX_CONCURRENT_REQUESTS,
+    CONF_MIN_UPDATE_INTERVAL, DEFAULT_MIN_UPDATE_INTERVAL, CONF_MAX_UPDATE_INTERVAL, DEFAULT_MAX_UPDATE_INTERVAL,
+    CONF_DISABLED_SENSORS, CONF_THRESHOLD_LEFT_PERCENTAGE, DEFAULT_THRESHOLD_LEFT_PERCENTAGE, CONF_THRESHOLD_LEFT_MB,
+    DEFAULT_THRESHOLD_LEFT_MB, CONF_THRESHOLD_EXPIRY_DAYS, DEFAULT_THRESHOLD_EXPIRY_DAYS, )
+from .sensor import SENSOR_DESCRIPTIONS
 
-_LOGGER = logging.getLogger(__name__)
+_LOGGER = get_logger(__name__)
 DATA_SCHEMA = {
     vol.Required(CONF_USERNAME): str,
     vol.Required(CONF_PASSWORD): str,
@@ -17,26 +26,121 @@ class SetupConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     CONNECTION_CLASS = config_entries.CONN_CLASS_CLOUD_POLL
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return OptionsFlowHandler(config_entry)
+
+    def __init__(self):
+        self._reauth_entry: config_entries.ConfigEntry | None = None
+
+    async def _async_validate(self, config: dict) -> tuple[ObsHttpClient | None, dict]:
+        """Logs in with config, returns the client on success or the errors of the form"""
+        _LOGGER.debug("Testing connectivity to OBS api")
+        try:
+            obs_http_client = async_get_client_registry(self.hass).create_client(config)
+            await obs_http_client.authenticate_and_store_token()
+        except ApiAuthError as exception:
+            _LOGGER.error("Error while login to Orange API. Credentials are likely incorrect : %s", exception)
+            return None, {"base": "auth_error"}
+        except Exception as e:
+            _LOGGER.error("Error while login to Orange API, unknown error: %s", e)
+            return None, {"base": "generic_error"}
+        _LOGGER.debug("Connectivity to Orange API validated")
+        return obs_http_client, {}
+
     async def async_step_user(self, user_input=None):
         """Called once with None as user_input, then a second time with user provided input"""
         errors = {}
-        valid = False
 
         if user_input is not None:
-            _LOGGER.debug(f"User input is {user_input}")
-            _LOGGER.info("Testing connectivity to OBS api")
-            try:
-                obs_http_client = ObsHttpClient(config=user_input, hass=self.hass)
-                await obs_http_client.authenticate_and_store_token()
-                valid = True
-            except ApiAuthError as exception:
-                _LOGGER.error(f"Error while login to Orange API. Credentials are likely incorrect : {exception}")
-                errors["base"] = "auth_error"
-            except Exception as e:
-                _LOGGER.error(f"Error while login to Orange API, unknown error: {e}")
-                errors["base"] = "generic_error"
-            if valid:
-                _LOGGER.debug("Connectivity to Orange API validated")
-                return self.async_create_entry(title="Orange Internet on the move Data", data=user_input)
+            _LOGGER.debug("User input is %s", user_input)
+            obs_http_client, errors = await self._async_validate(user_input)
+            if obs_http_client is not None:
+                try:
+                    # cached by the client, the first refresh of the entry reuses it
+                    devices = await obs_http_client.get_devices_info()
+                    _LOGGER.debug("%s device(s) found", len(devices))
+                except Exception as e:
+                    _LOGGER.error("Error while fetching the devices from Orange API: %s", e)
+                    errors = {"base": "generic_error"}
+                    obs_http_client.forget_secrets()
+                else:
+                    # the entry setup uses this client and its token instead of logging in again
+                    async_get_client_registry(self.hass).hand_off(obs_http_client)
+                    return self.async_create_entry(title="Orange Internet on the move Data", data=user_input)
         # If there is no user input or there were errors, show the form again, including any errors that were found with the input.
         return self.async_show_form(step_id="user", data_schema=vol.Schema(DATA_SCHEMA), errors=errors)
+
+    async def async_step_reauth(self, entry_data):
+        """Started when the API rejects the credentials of an entry"""
+        self._reauth_entry = self.hass.config_entries.async_get_entry(self.context["entry_id"])
+        return await self.async_step_reauth_confirm()
+
+    async def async_step_reauth_confirm(self, user_input=None):
+        """New password of the account, swapped in place: loaded entries keep their entities"""
+        errors = {}
+        username = self._reauth_entry.data[CONF_USERNAME]
+        if user_input is not None:
+            config = {**self._reauth_entry.data, CONF_PASSWORD: user_input[CONF_PASSWORD]}
+            obs_http_client, errors = await self._async_validate(config)
+            if obs_http_client is not None:
+                async_get_client_registry(self.hass).update_credentials(obs_http_client)
+                coordinators = self.hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {})
+                # every entry of the account shares the client and gets the new password
+                for entry in self.hass.config_entries.async_entries(DOMAIN):
+                    if entry.data[CONF_USERNAME] != username:
+                        continue
+                    self.hass.config_entries.async_update_entry(entry, data=config)
+                    coordinator = coordinators.get(entry.entry_id)
+                    if entry.state is config_entries.ConfigEntryState.LOADED and coordinator is not None:
+                        # polling stopped on the auth failure, refreshing resumes it
+                        self.hass.async_create_task(coordinator.async_refresh())
+                    else:
+                        self.hass.async_create_task(self.hass.config_entries.async_reload(entry.entry_id))
+                return self.async_abort(reason="reauth_successful")
+        return self.async_show_form(step_id="reauth_confirm",
+                                    data_schema=vol.Schema({vol.Required(CONF_PASSWORD): str}),
+                                    errors=errors, description_placeholders={"username": username})
+
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Polling settings of an entry, saving them reloads the entry"""
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            _LOGGER.debug("Options input is %s", user_input)
+            if user_input[CONF_MIN_UPDATE_INTERVAL] > user_input[CONF_MAX_UPDATE_INTERVAL]:
+                errors["base"] = "invalid_interval_range"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        options_schema = {
+            vol.Required(CONF_MAX_CONCURRENT_REQUESTS,
+                         default=min(options.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS),
+                                     GLOBAL_MAX_CONCURRENT_REQUESTS)):
+                vol.All(vol.Coerce(int), vol.Range(min=1, max=GLOBAL_MAX_CONCURRENT_REQUESTS)),
+            vol.Required(CONF_MIN_UPDATE_INTERVAL,
+                         default=options.get(CONF_MIN_UPDATE_INTERVAL, DEFAULT_MIN_UPDATE_INTERVAL)):
+                vol.All(vol.Coerce(int), vol.Range(min=1, max=1440)),
+            vol.Required(CONF_MAX_UPDATE_INTERVAL,
+                         default=options.get(CONF_MAX_UPDATE_INTERVAL, DEFAULT_MAX_UPDATE_INTERVAL)):
+                vol.All(vol.Coerce(int), vol.Range(min=1, max=1440)),
+            vol.Required(CONF_THRESHOLD_LEFT_PERCENTAGE,
+                         default=options.get(CONF_THRESHOLD_LEFT_PERCENTAGE, DEFAULT_THRESHOLD_LEFT_PERCENTAGE)):
+                vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+            vol.Required(CONF_THRESHOLD_LEFT_MB,
+                         default=options.get(CONF_THRESHOLD_LEFT_MB, DEFAULT_THRESHOLD_LEFT_MB)):
+                vol.All(vol.Coerce(int), vol.Range(min=0)),
+            vol.Required(CONF_THRESHOLD_EXPIRY_DAYS,
+                         default=options.get(CONF_THRESHOLD_EXPIRY_DAYS, DEFAULT_THRESHOLD_EXPIRY_DAYS)):
+                vol.All(vol.Coerce(int), vol.Range(min=0, max=365)),
+            vol.Optional(CONF_DISABLED_SENSORS, default=options.get(CONF_DISABLED_SENSORS, [])):
+                cv.multi_select({description.key: description.name for description in SENSOR_DESCRIPTIONS}),
+        }
+        return self.async_show_form(step_id="init", data_schema=vol.Schema(options_schema), errors=errors)
@@ -12,3 +12,123 @@ ENDPOINT_USER = "/user-api/user"
 ENDPOINT_DEVICES = "/user-api/devices"
 ENDPOINT_DEVICE_SUBSCRIPTION = "/subscription"
 ENDPOINT_DEVICE_CONSUMPTION = "/consumption"
+
+STORAGE_VERSION = 1
+STORAGE_KEY_TOKEN = DOMAIN + ".token_{}"
+
+# Safety margin applied before a token expiry returned by the API
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+
+DATA_CLIENT_REGISTRY = "client_registry"
+
+# Dedicated HTTP session used for every call to the OBS host, its connection limit is HTTP_LIMIT_PER_HOST below
+HTTP_KEEPALIVE_TIMEOUT_SECONDS = 120
+HTTP_DNS_CACHE_TTL_SECONDS = 600
+HTTP_TOTAL_TIMEOUT_SECONDS = 30
+HTTP_CONNECT_TIMEOUT_SECONDS = 10
+
+# Adaptive polling, intervals in minutes in the options
+CONF_MIN_UPDATE_INTERVAL = "min_update_interval"
+CONF_MAX_UPDATE_INTERVAL = "max_update_interval"
+DEFAULT_MIN_UPDATE_INTERVAL = 10
+DEFAULT_MAX_UPDATE_INTERVAL = 360
+NOMINAL_UPDATE_INTERVAL_SECONDS = 3600
+# number of identical left_data samples after which a device is considered idle
+IDLE_SAMPLES = 3
+# below this ratio of left_data / initial_data polling speeds up
+LOW_DATA_RATIO = 0.25
+# number of polls wanted before the plan expires
+POLLS_BEFORE_EXPIRY = 4
+
+# Consumption history kept per device (samples of left_data)
+STORAGE_KEY_HISTORY = DOMAIN + ".history_{}"
+HISTORY_CAPACITY = 720
+HISTORY_SAVE_DELAY_SECONDS = 60
+BURN_RATE_WINDOW_HOURS = 24
+
+# Resilience of the calls to the OBS API
+REQUEST_TIMEOUT_SECONDS = 15
+REFRESH_TIMEOUT_SECONDS = 120
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 1
+RETRY_MAX_DELAY_SECONDS = 30
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOL_DOWN_SECONDS = 600
+
+# Concurrent identical calls share one request, their result is reused for this many seconds
+SINGLE_FLIGHT_FRESHNESS_SECONDS = 10
+
+# Time to live of the cached results of each endpoint class
+DEVICES_CACHE_TTL_SECONDS = 24 * 3600
+SUBSCRIPTION_CACHE_TTL_SECONDS = 24 * 3600
+
+# Last good data of the devices, restored at startup
+STORAGE_KEY_LAST_DATA = DOMAIN + ".last_data_{}"
+LAST_DATA_SAVE_DELAY_SECONDS = 10
+
+DATA_ORIGIN_LIVE = "live"
+DATA_ORIGIN_RESTORED = "restored"
+DATA_ORIGIN_STALE = "stale"
+
+# options each loaded entry was set up with, an update of the entry data alone does not reload it
+DATA_APPLIED_OPTIONS = "applied_options"
+DATA_COORDINATORS = "coordinators"
+
+# On demand refresh service
+SERVICE_REFRESH = "refresh"
+ATTR_DEVICE_ID = "device_id"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+# calls within this delay are coalesced into one refresh
+SERVICE_REFRESH_DEBOUNCE_SECONDS = 2
+# token bucket of on demand refreshes, per account
+SERVICE_REFRESH_BURST = 3
+SERVICE_REFRESH_TOKENS_PER_HOUR = 12
+
+CONF_DISABLED_SENSORS = "disabled_sensors"
+
+DATA_GLOBAL_SCHEDULER = "global_scheduler"
+# refreshes of the config entries are spread over this window
+STAGGER_WINDOW_SECONDS = 300
+# maximum requests in flight to the OBS API across all accounts
+GLOBAL_MAX_CONCURRENT_REQUESTS = 6
+# one connection per request the global cap lets in flight, it also bounds the max concurrent requests option
+HTTP_LIMIT_PER_HOST = GLOBAL_MAX_CONCURRENT_REQUESTS
+
+# Threshold alerts fired on the event bus
+EVENT_THRESHOLD = DOMAIN + "_threshold"
+STORAGE_KEY_THRESHOLDS = DOMAIN + ".thresholds_{}"
+CONF_THRESHOLD_LEFT_PERCENTAGE = "threshold_left_percentage"
+CONF_THRESHOLD_LEFT_MB = "threshold_left_mb"
+CONF_THRESHOLD_EXPIRY_DAYS = "threshold_expiry_days"
+DEFAULT_THRESHOLD_LEFT_PERCENTAGE = 10
+# 0 disables the threshold
+DEFAULT_THRESHOLD_LEFT_MB = 0
+DEFAULT_THRESHOLD_EXPIRY_DAYS = 2
+# an alert is cleared once the value is back above threshold + hysteresis
+HYSTERESIS_LEFT_PERCENTAGE = 2
+HYSTERESIS_LEFT_MB_RATIO = 0.05
+HYSTERESIS_EXPIRY_DAYS = 1
+
+# responses are rejected above this size, list responses are decoded while read in chunks of this size
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+STREAM_CHUNK_BYTES = 16 * 1024
+# the rest of a list left unread by its caller is still read up to this size, to keep the connection alive
+STREAM_DRAIN_MAX_BYTES = 64 * 1024
+
+# upper bounds of the histogram buckets of the diagnostics
+LATENCY_BUCKETS_SECONDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+REFRESH_DURATION_BUCKETS_SECONDS = (1, 2.5, 5, 10, 30, 60, 120)
+
+# format of the record and replay cassettes of the transports
+CASSETTE_VERSION = 1
+
+# Hourly data usage imported as external statistics
+STORAGE_KEY_STATISTICS = DOMAIN + ".statistics_{}"
+STATISTICS_SAVE_DELAY_SECONDS = 60
+# usage after a longer outage is spread over this many hours only
+STATISTICS_MAX_BACKFILL_HOURS = 24 * 31
+# entry importing the statistics of each device, the entries of one account share its devices
+DATA_STATISTICS_OWNERS = "statistics_owners"
@@ -0,0 +1,166 @@
+"""Schema driven decoding of the OBS API payloads into the DTOs.
+
+Every item is validated and converted in a single pass, a malformed item is skipped
+(and logged) instead of failing the whole response. List responses can also be decoded
+while they are read, one item at a time, so only the current item is ever materialized.
+"""
+import codecs
+import json
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any, Callable, TypeVar
+
+import voluptuous as vol
+from homeassistant.helpers import config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .log import get_logger
+from .dto import ConsumptionOfDevice, Device, SubscriptionOfDevice
+
+_LOGGER = get_logger(__name__)
+
+T = TypeVar("T")
+
+_JSON_WHITESPACE = " \t\n\r"
+
+
+def iso_datetime(value: Any):
+    """ISO 8601 string to an aware UTC datetime, naive values are considered UTC"""
+    parsed = dt_util.parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise vol.Invalid(f"invalid ISO date {value!r}")
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=dt_util.UTC)
+    return dt_util.as_utc(parsed)
+
+
+DEVICE_SCHEMA = vol.Schema({
+    vol.Required("id"): cv.string,
+    vol.Required("country"): cv.string,
+    vol.Required("status"): cv.string,
+    vol.Required("tag"): cv.string,
+    vol.Required("user"): vol.Schema({
+        vol.Required("id"): cv.string,
+        vol.Required("name"): cv.string,
+    }, extra=vol.ALLOW_EXTRA),
+    vol.Required("creation_date"): iso_datetime,
+    vol.Required("serial_number"): cv.string,
+}, extra=vol.REMOVE_EXTRA)
+
+CONSUMPTION_SCHEMA = vol.Schema({
+    vol.Required("type"): cv.string,
+    vol.Required("initial_data"): vol.Coerce(int),
+    vol.Required("left_data"): vol.Coerce(int),
+    vol.Required("expiry_date"): iso_datetime,
+    vol.Required("start_date"): iso_datetime,
+}, extra=vol.REMOVE_EXTRA)
+
+SUBSCRIPTION_SCHEMA = vol.Schema({
+    # null fields are missing values rather than malformed ones
+    vol.Optional("name"): vol.Maybe(cv.string),
+    vol.Optional("status"): vol.Maybe(cv.string),
+    vol.Optional("start_date"): vol.Maybe(iso_datetime),
+    vol.Optional("expiry_date"): vol.Maybe(iso_datetime),
+}, extra=vol.REMOVE_EXTRA)
+
+
+def device_from_item(item: dict) -> Device:
+    return Device(item["id"], item["country"], item["status"], item["tag"], item["user"]["id"],
+                  item["user"]["name"], item["creation_date"], item["serial_number"])
+
+
+def consumption_from_item(item: dict) -> ConsumptionOfDevice:
+    return ConsumptionOfDevice(item["type"], item["initial_data"], item["left_data"], item["expiry_date"],
+                               item["start_date"])
+
+
+def subscription_from_item(item: dict) -> SubscriptionOfDevice:
+    return SubscriptionOfDevice(**item)
+
+
+def decode_item(item: Any, schema: vol.Schema, factory: Callable[[dict], T]) -> T | None:
+    try:
+        return factory(schema(item))
+    except vol.Invalid as err:
+        _LOGGER.warning("Ignoring malformed item from OBS API: %s", err)
+        return None
+
+
+def decode_items(payload: Any, schema: vol.Schema, factory: Callable[[dict], T]) -> list[T]:
+    if not isinstance(payload, list):
+        raise vol.Invalid(f"expected a list, got {type(payload).__name__}")
+    decoded = (decode_item(item, schema, factory) for item in payload)
+    return [item for item in decoded if item is not None]
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes], max_bytes: int) -> AsyncIterator[Any]:
+    """Items of a top level JSON array, parsed as soon as they are complete in the body read so far.
+
+    Reading stops at the closing bracket, vol.Invalid is raised for anything but an array, for a
+    truncated body and for a body larger than max_bytes.
+    """
+    json_decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunk_iterator = aiter(chunks)
+    buffer = ""
+    position = 0
+    size = 0
+    eof = False
+    # "[" expected first, then an item (or "]" right after "["), then "," or "]" after each item
+    expecting = "start"
+
+    while True:
+        while position < len(buffer) and buffer[position] in _JSON_WHITESPACE:
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if expecting == "start":
+                if char != "[":
+                    raise vol.Invalid("expected a list")
+                position += 1
+                expecting = "first"
+                continue
+            if char == "]" and expecting in ("first", "separator"):
+                return
+            if expecting == "separator":
+                if char != ",":
+                    raise vol.Invalid(f"unexpected {char!r} between list items")
+                position += 1
+                expecting = "item"
+                continue
+            try:
+                item, end = json_decoder.raw_decode(buffer, position)
+            except ValueError:
+                end = None
+            # a value ending with the buffer may be cut (a number), it is only trusted at the end of the body
+            if end is not None and (end < len(buffer) or eof):
+                position = end
+                expecting = "separator"
+                yield item
+                continue
+        if eof:
+            raise vol.Invalid("truncated list")
+
+        chunk = await anext(chunk_iterator, None)
+        if chunk is None:
+            eof = True
+            buffer = buffer[position:] + text_decoder.decode(b"", final=True)
+        else:
+            size += len(chunk)
+            if size > max_bytes:
+                raise vol.Invalid(f"response larger than {max_bytes} bytes")
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+
+async def decode_stream(chunks: AsyncIterable[bytes], schema: vol.Schema, factory: Callable[[dict], T],
+                        max_bytes: int) -> AsyncIterator[T]:
+    async for item in iter_json_array(chunks, max_bytes):
+        decoded = decode_item(item, schema, factory)
+        if decoded is not None:
+            yield decoded
+
+
+def decode_subscriptions(payload: Any) -> list[SubscriptionOfDevice]:
+    if isinstance(payload, dict):
+        payload = [payload]
+    return decode_items(payload, SUBSCRIPTION_SCHEMA, subscription_from_item)
@@ -0,0 +1,48 @@
+"""Diagnostics download of a config entry: options, refresh timings and OBS API metrics.
+
+Credentials and device ids are redacted, the token itself is never included, only its validity.
+"""
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_COORDINATORS, CONF_USERNAME, CONF_PASSWORD
+
+TO_REDACT = {CONF_USERNAME, CONF_PASSWORD, "device_id"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    diagnostics: dict[str, Any] = {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options),
+        },
+    }
+
+    client = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if client is not None:
+        diagnostics["api"] = {
+            "token_valid": client.is_token_valid(),
+            "token_issued_at": client.token_issued_at,
+            "token_expires_at": client.token_expires_at,
+            "circuit_breaker": {
+                "state": client.circuit_breaker.state,
+                "failure_count": client.circuit_breaker.failure_count,
+                "remaining_cool_down": round(client.circuit_breaker.remaining_cool_down),
+            },
+            "metrics": client.metrics.as_dict(),
+        }
+
+    coordinator = hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).get(entry.entry_id)
+    if coordinator is not None:
+        diagnostics["coordinator"] = {
+            "last_update_success": coordinator.last_update_success,
+            "data_origin": coordinator.data_origin,
+            "update_interval_seconds": coordinator.update_interval.total_seconds()
+            if coordinator.update_interval else None,
+            "refresh": coordinator.refresh_metrics.as_dict(),
+            "devices": [async_redact_data(snapshot.as_dict(), TO_REDACT) for snapshot in coordinator.snapshots.values()],
+        }
+    return diagnostics
@@ -1,43 +1,115 @@
-class ConsumptionOfDevice:
-    def __init__(self, contract_type, initial_data, left_data, expiry_date, start_date):
-        self.type = contract_type
-        self.initial_data = initial_data
-        self.left_data = left_data
-        self.expiry_date = expiry_date
-        self.start_date = start_date
+from __future__ import annotations
 
-    def __repr__(self):
-        return str(self.__dict__)
+from dataclasses import dataclass, replace
+from datetime import datetime
+from math import floor
+from typing import ClassVar, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from .history import ConsumptionHistory
 
-# for later use
-class SubscriptionOfDevice:
-    def __init__(self, todo):
-        self.todo = todo
 
-    def __repr__(self):
-        return str(self.__dict__)
+@dataclass(frozen=True, slots=True)
+class ConsumptionOfDevice:
+    type: str
+    initial_data: int
+    left_data: int
+    expiry_date: datetime
+    start_date: datetime
 
 
-class Device:
-    def __init__(self, device_id, country, status, tag, user_id, user_name, creation_date, serial_number):
-        self.device_id = device_id
-        self.country = country
-        self.status = status
-        self.tag = tag
-        self.user_id = user_id
-        self.user_name = user_name
-        self.creation_date = creation_date
-        self.serial_number = serial_number
+@dataclass(frozen=True, slots=True)
+class SubscriptionOfDevice:
+    # the subscription payload is not documented, every field is optional
+    name: str | None = None
+    status: str | None = None
+    start_date: datetime | None = None
+    expiry_date: datetime | None = None
+
 
-    def __repr__(self):
-        return str(self.__dict__)
+@dataclass(frozen=True, slots=True)
+class Device:
+    device_id: str
+    country: str
+    status: str
+    tag: str
+    user_id: str
+    user_name: str
+    creation_date: datetime
+    serial_number: str
 
 
+@dataclass(frozen=True, slots=True)
 class OBSFullData:
-    def __init__(self, device: Device, consumption: ConsumptionOfDevice):
-        self.device = device
-        self.consumption = consumption
+    device: Device
+    consumption: ConsumptionOfDevice
+    subscription: SubscriptionOfDevice | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceSnapshot:
+    """Sensor values of a device computed once per refresh, with the fields changed since the previous one"""
+    device_id: str
+    start_date: datetime | None
+    expiry_date: datetime | None
+    initial_data_mb: float
+    left_data_mb: float
+    left_data_percentage: int | None
+    plan_type: str
+    burn_rate_mb_per_hour: float | None = None
+    average_daily_usage_mb: float | None = None
+    depletion_date: datetime | None = None
+    subscription_name: str | None = None
+    subscription_status: str | None = None
+    subscription_start_date: datetime | None = None
+    subscription_expiry_date: datetime | None = None
+    changed: frozenset[str] = frozenset()
+
+    VALUE_FIELDS: ClassVar[tuple[str, ...]] = ("start_date", "expiry_date", "initial_data_mb", "left_data_mb",
+                                               "left_data_percentage", "plan_type", "burn_rate_mb_per_hour",
+                                               "average_daily_usage_mb", "depletion_date", "subscription_name",
+                                               "subscription_status", "subscription_start_date",
+                                               "subscription_expiry_date")
+
+    @classmethod
+    def from_full_data(cls, obs_full_data: OBSFullData, previous: DeviceSnapshot | None = None,
+                       history: ConsumptionHistory | None = None) -> DeviceSnapshot:
+        consumption = obs_full_data.consumption
+        subscription = obs_full_data.subscription
+        burn_rate = history.burn_rate() if history is not None else None
+        average_daily_usage = history.average_daily_usage() if history is not None else None
+        values = {
+            "start_date": consumption.start_date,
+            "expiry_date": consumption.expiry_date,
+            "initial_data_mb": consumption.initial_data / 1024,
+            "left_data_mb": consumption.left_data / 1024,
+            "left_data_percentage":
+                floor(consumption.left_data / consumption.initial_data * 100) if consumption.initial_data else None,
+            "plan_type": consumption.type,
+            "burn_rate_mb_per_hour": round(burn_rate / 1024, 2) if burn_rate is not None else None,
+            "average_daily_usage_mb": round(average_daily_usage / 1024, 2) if average_daily_usage is not None else None,
+            "depletion_date": history.depletion_date() if history is not None else None,
+            "subscription_name": subscription.name if subscription is not None else None,
+            "subscription_status": subscription.status if subscription is not None else None,
+            "subscription_start_date": subscription.start_date if subscription is not None else None,
+            "subscription_expiry_date": subscription.expiry_date if subscription is not None else None,
+        }
+        if previous is None:
+            changed = frozenset(cls.VALUE_FIELDS)
+        else:
+            changed = frozenset(field for field in cls.VALUE_FIELDS if getattr(previous, field) != values[field])
+        return cls(device_id=obs_full_data.device.device_id, changed=changed, **values)
+
+    @property
+    def depletes_before_expiry(self) -> bool | None:
+        if self.depletion_date is None or self.expiry_date is None:
+            return None
+        return self.depletion_date < self.expiry_date
+
+    def unchanged(self) -> DeviceSnapshot:
+        return replace(self, changed=frozenset())
 
-    def __repr__(self):
-        return str(self.__dict__)
+    def as_dict(self) -> dict:
+        """Values of the snapshot, dates as ISO strings"""
+        values = {name: getattr(self, name) for name in ("device_id", *self.VALUE_FIELDS)}
+        return {name: value.isoformat() if isinstance(value, datetime) else value for name, value in values.items()}
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DOMAIN, DATA_GLOBAL_SCHEDULER, STAGGER_WINDOW_SECONDS, GLOBAL_MAX_CONCURRENT_REQUESTS
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+
+class GlobalPollScheduler:
+    """Integration wide pacing of the calls to the OBS API.
+
+    Gives each config entry a deterministic phase offset so the entries do not refresh in
+    lockstep, caps the requests in flight across all accounts and pauses every account when
+    the provider answers 429 with a Retry-After.
+    """
+
+    def __init__(self, hass: HomeAssistant, max_concurrent_requests: int = GLOBAL_MAX_CONCURRENT_REQUESTS):
+        self.hass = hass
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._paused_until = 0.0
+
+    @callback
+    def phase_offset(self, entry_id: str) -> timedelta:
+        """Offset of the entry, evenly spread over the stagger window by rank of entry id"""
+        entry_ids = sorted(entry.entry_id for entry in self.hass.config_entries.async_entries(DOMAIN))
+        if entry_id not in entry_ids or len(entry_ids) < 2:
+            return timedelta(0)
+        offset = timedelta(seconds=STAGGER_WINDOW_SECONDS * entry_ids.index(entry_id) / len(entry_ids))
+        _LOGGER.debug("Phase offset of entry %s is %s", entry_id, offset)
+        return offset
+
+    @callback
+    def throttle(self, retry_after: float | None) -> None:
+        """The provider asked to slow down, every account waits"""
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            _LOGGER.debug("OBS API throttled, requests paused for %s seconds", retry_after)
+
+    @asynccontextmanager
+    async def request_slot(self):
+        async with self._semaphore:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            yield
+
+
+@callback
+def async_get_global_scheduler(hass: HomeAssistant) -> GlobalPollScheduler:
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_GLOBAL_SCHEDULER not in domain_data:
+        domain_data[DATA_GLOBAL_SCHEDULER] = GlobalPollScheduler(hass)
+    return domain_data[DATA_GLOBAL_SCHEDULER]
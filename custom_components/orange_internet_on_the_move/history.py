@@ -0,0 +1,155 @@
+from array import array
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    STORAGE_VERSION, STORAGE_KEY_HISTORY, HISTORY_CAPACITY, HISTORY_SAVE_DELAY_SECONDS, BURN_RATE_WINDOW_HOURS,
+)
+from .dto import ConsumptionOfDevice
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+
+class ConsumptionHistory:
+    """Fixed size ring buffer of (timestamp, left_data) samples of the current plan of a device.
+
+    Timestamps (epoch seconds) and left_data (KB) are stored in two arrays, the buffer is
+    emptied when a new plan period starts (start_date changes).
+    """
+    __slots__ = ("capacity", "start_date", "_timestamps", "_left_data", "_head", "_size")
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY, start_date: datetime | None = None):
+        self.capacity = capacity
+        self.start_date = start_date
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._left_data = array("q", bytes(8 * capacity))
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def reset(self, start_date: datetime | None) -> None:
+        self.start_date = start_date
+        self._head = 0
+        self._size = 0
+
+    def _index(self, position: int) -> int:
+        """Array index of the sample at position, 0 being the oldest sample"""
+        return (self._head - self._size + position) % self.capacity
+
+    def last(self) -> tuple[float, int] | None:
+        if not self._size:
+            return None
+        index = self._index(self._size - 1)
+        return self._timestamps[index], self._left_data[index]
+
+    def append(self, timestamp: float, left_data: int) -> bool:
+        last = self.last()
+        if last is not None and timestamp <= last[0]:
+            return False
+        self._timestamps[self._head] = timestamp
+        self._left_data[self._head] = left_data
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        return True
+
+    def samples(self):
+        for position in range(self._size):
+            index = self._index(position)
+            yield self._timestamps[index], self._left_data[index]
+
+    def _rate_since(self, since: float) -> float | None:
+        """Consumption in KB per second between the first sample after since and the last one"""
+        last = self.last()
+        if last is None:
+            return None
+        first = next(((timestamp, left) for timestamp, left in self.samples() if timestamp >= since), None)
+        if first is None or first[0] >= last[0]:
+            return None
+        return max(first[1] - last[1], 0) / (last[0] - first[0])
+
+    def burn_rate(self) -> float | None:
+        """Recent consumption in KB per hour, over the last BURN_RATE_WINDOW_HOURS of samples"""
+        last = self.last()
+        if last is None:
+            return None
+        rate = self._rate_since(last[0] - BURN_RATE_WINDOW_HOURS * 3600)
+        return rate * 3600 if rate is not None else None
+
+    def average_daily_usage(self) -> float | None:
+        """Consumption in KB per day over the whole buffer"""
+        rate = self._rate_since(0)
+        return rate * 86400 if rate is not None else None
+
+    def depletion_date(self) -> datetime | None:
+        """Date the plan will be used up at the average rate"""
+        last = self.last()
+        rate = self._rate_since(0)
+        if last is None or not rate:
+            return None
+        return dt_util.utc_from_timestamp(last[0] + last[1] / rate)
+
+    def as_dict(self) -> dict:
+        return {
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "samples": [[timestamp, left_data] for timestamp, left_data in self.samples()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConsumptionHistory":
+        history = cls(start_date=dt_util.parse_datetime(data["start_date"]) if data.get("start_date") else None)
+        for timestamp, left_data in data.get("samples", []):
+            history.append(timestamp, left_data)
+        return history
+
+
+class ConsumptionHistoryStore:
+    """Histories of the devices of an entry, persisted with a delayed save after each refresh"""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_HISTORY.format(entry_id))
+        self._histories: dict[str, ConsumptionHistory] = {}
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = await self._store.async_load() or {}
+        for device_id, data in stored.get("devices", {}).items():
+            try:
+                self._histories[device_id] = ConsumptionHistory.from_dict(data)
+            except (KeyError, TypeError, ValueError) as err:
+                _LOGGER.warning("Ignoring stored history of device %s: %s", device_id, err)
+
+    def get(self, device_id: str) -> ConsumptionHistory | None:
+        return self._histories.get(device_id)
+
+    @callback
+    def add_sample(self, device_id: str, consumption: ConsumptionOfDevice, now: datetime) -> ConsumptionHistory:
+        history = self._histories.get(device_id)
+        if history is None:
+            history = self._histories[device_id] = ConsumptionHistory(start_date=consumption.start_date)
+        elif history.start_date != consumption.start_date:
+            _LOGGER.debug("New plan period for device %s, history reset", device_id)
+            history.reset(consumption.start_date)
+        if history.append(now.timestamp(), consumption.left_data):
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY_SECONDS)
+        return history
+
+    @callback
+    def forget_device(self, device_id: str) -> None:
+        if self._histories.pop(device_id, None) is not None:
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY_SECONDS)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"devices": {device_id: history.as_dict() for device_id, history in self._histories.items()}}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
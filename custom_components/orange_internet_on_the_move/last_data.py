@@ -0,0 +1,65 @@
+from dataclasses import asdict
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import STORAGE_VERSION, STORAGE_KEY_LAST_DATA, LAST_DATA_SAVE_DELAY_SECONDS
+from .dto import ConsumptionOfDevice, Device, OBSFullData, SubscriptionOfDevice
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    return value
+
+
+def _parse_dates(data: dict, *fields: str) -> dict:
+    return {key: dt_util.parse_datetime(value) if key in fields and value else value for key, value in data.items()}
+
+
+def full_data_from_dict(data: dict) -> OBSFullData:
+    subscription = data.get("subscription")
+    return OBSFullData(
+        device=Device(**_parse_dates(data["device"], "creation_date")),
+        consumption=ConsumptionOfDevice(**_parse_dates(data["consumption"], "start_date", "expiry_date")),
+        subscription=SubscriptionOfDevice(**_parse_dates(subscription, "start_date", "expiry_date"))
+        if subscription else None,
+    )
+
+
+class LastDataStore:
+    """Last good data of the devices of an entry, so entities can be created before any network call"""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_LAST_DATA.format(entry_id))
+        self._data: dict[str, OBSFullData] = {}
+
+    async def async_load(self) -> dict[str, OBSFullData]:
+        stored = await self._store.async_load() or {}
+        data = {}
+        for device_id, device_data in stored.get("devices", {}).items():
+            try:
+                data[device_id] = full_data_from_dict(device_data)
+            except (KeyError, TypeError, ValueError) as err:
+                _LOGGER.warning("Ignoring stored data of device %s: %s", device_id, err)
+        return data
+
+    @callback
+    def async_save(self, data: dict[str, OBSFullData]) -> None:
+        self._data = data
+        self._store.async_delay_save(self._data_to_save, LAST_DATA_SAVE_DELAY_SECONDS)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"devices": {device_id: _to_json(asdict(obs_full_data))
+                            for device_id, obs_full_data in self._data.items()}}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -0,0 +1,93 @@
+"""Logging helpers of the integration.
+
+Loggers returned by get_logger redact credentials and tokens from the log arguments. The
+filter only runs when a record is actually emitted, so with %-style arguments nothing is
+formatted or redacted while the level is disabled.
+"""
+import logging
+import re
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any
+
+from .const import CONF_PASSWORD
+
+REDACTED = "**REDACTED**"
+SENSITIVE_KEYS = frozenset({"authorization", "x-auth-token", "token", "password", CONF_PASSWORD, "puk", "cookie",
+                            "set-cookie"})
+
+# shorter values would match all over the logs, they are only redacted under a sensitive key
+MIN_SECRET_LENGTH = 6
+
+# secret values in use (tokens, validated passwords) with their number of registrations, replaced
+# wherever they show up as a whole word in a log argument
+_secrets: Counter[str] = Counter()
+_secrets_pattern: re.Pattern | None = None
+
+
+def register_secret(value: str | None) -> None:
+    global _secrets_pattern
+    if value and len(value) >= MIN_SECRET_LENGTH:
+        _secrets[value] += 1
+        _secrets_pattern = None
+
+
+def unregister_secret(value: str | None) -> None:
+    """Undoes one register_secret of value, it is redacted until its last registration is undone"""
+    global _secrets_pattern
+    if value not in _secrets:
+        return
+    _secrets[value] -= 1
+    if _secrets[value] <= 0:
+        del _secrets[value]
+        _secrets_pattern = None
+
+
+def _pattern() -> re.Pattern | None:
+    global _secrets_pattern
+    if _secrets_pattern is None and _secrets:
+        # longest first, so a secret containing another one is redacted whole
+        alternatives = "|".join(re.escape(secret) for secret in sorted(_secrets, key=len, reverse=True))
+        _secrets_pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+    return _secrets_pattern
+
+
+def _redact_string(value: str) -> str:
+    pattern = _pattern()
+    return pattern.sub(REDACTED, value) if pattern is not None else value
+
+
+def redact(value: Any) -> Any:
+    """Copy of value with sensitive keys and known secrets replaced"""
+    if isinstance(value, Mapping):
+        return {key: REDACTED if str(key).lower() in SENSITIVE_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    if isinstance(value, str):
+        return _redact_string(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    # any other object is formatted now (the record is being emitted) and scrubbed
+    return _redact_string(str(value))
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.args:
+            if isinstance(record.args, Mapping):
+                record.args = redact(record.args)
+            else:
+                record.args = tuple(redact(arg) for arg in record.args)
+        if isinstance(record.msg, str):
+            record.msg = _redact_string(record.msg)
+        return True
+
+
+_REDACTING_FILTER = RedactingFilter()
+
+
+def get_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if _REDACTING_FILTER not in logger.filters:
+        logger.addFilter(_REDACTING_FILTER)
+    return logger
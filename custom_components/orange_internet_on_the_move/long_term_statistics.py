@@ -0,0 +1,213 @@
+"""Hourly data usage of the devices, imported into the recorder as external statistics.
+
+The usage between two samples of left_data is spread over the hours they span, so the hours
+missed while Home Assistant was down are backfilled. A new plan period (start_date changes)
+counts the usage of the new plan only. Completed hours are imported in one batch per device
+and refresh, the daily and monthly values are aggregated by the recorder from the hourly sums.
+
+The statistics of a device are imported by one entry only, and the running sum resumes from the
+last one already in the recorder, so an entry added again or a device coming back continues it.
+"""
+import math
+from datetime import datetime
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics, get_last_statistics
+from homeassistant.const import UnitOfInformation
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import (
+    DOMAIN, STORAGE_VERSION, STORAGE_KEY_STATISTICS, STATISTICS_SAVE_DELAY_SECONDS, STATISTICS_MAX_BACKFILL_HOURS,
+    DATA_STATISTICS_OWNERS,
+)
+from .dto import ConsumptionOfDevice, Device
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+HOUR_SECONDS = 3600
+
+
+def statistic_id_of(device_id: str) -> str:
+    return f"{DOMAIN}:data_used_{slugify(device_id)}"
+
+
+def spread_usage(pending: dict[int, float], start: float, end: float, usage: float) -> None:
+    """Adds usage between the timestamps start and end to the hours they span, in proportion of the overlap.
+
+    Every hour spanned gets an entry, even without usage, so the imported sum has no gap.
+    """
+    start = max(start, end - STATISTICS_MAX_BACKFILL_HOURS * HOUR_SECONDS)
+    hour = math.floor(start / HOUR_SECONDS) * HOUR_SECONDS
+    if end <= start:
+        pending[hour] = pending.get(hour, 0.0) + usage
+        return
+    while hour < end:
+        overlap = min(hour + HOUR_SECONDS, end) - max(hour, start)
+        pending[hour] = pending.get(hour, 0.0) + usage * overlap / (end - start)
+        hour += HOUR_SECONDS
+
+
+class DeviceUsage:
+    """Last sample of a device, the running sum of its usage (MB) and the usage of the hours not imported yet"""
+    __slots__ = ("timestamp", "left_data", "start_date", "sum", "pending")
+
+    def __init__(self, timestamp: float, left_data: int, start_date: datetime | None, total: float = 0.0,
+                 pending: dict[int, float] | None = None):
+        self.timestamp = timestamp
+        self.left_data = left_data
+        self.start_date = start_date
+        self.sum = total
+        self.pending: dict[int, float] = pending if pending is not None else {}
+
+    def add_sample(self, consumption: ConsumptionOfDevice, timestamp: float) -> None:
+        if timestamp <= self.timestamp:
+            return
+        start = self.timestamp
+        if consumption.start_date != self.start_date:
+            # usage of the new plan only, the end of the previous one after its last sample is unknown
+            used_kb = consumption.initial_data - consumption.left_data
+            if consumption.start_date is not None:
+                start = max(start, consumption.start_date.timestamp())
+        else:
+            used_kb = self.left_data - consumption.left_data
+        # data added to the plan during the period is not usage
+        spread_usage(self.pending, start, timestamp, max(used_kb, 0) / 1024)
+        self.timestamp = timestamp
+        self.left_data = consumption.left_data
+        self.start_date = consumption.start_date
+
+    def completed_hours(self, now: float) -> list[StatisticData]:
+        """Statistics of the pending hours that are over, removed from pending"""
+        current_hour = math.floor(now / HOUR_SECONDS) * HOUR_SECONDS
+        statistics = []
+        for hour in sorted(hour for hour in self.pending if hour < current_hour):
+            self.sum += self.pending.pop(hour)
+            statistics.append(StatisticData(start=dt_util.utc_from_timestamp(hour), sum=round(self.sum, 3)))
+        return statistics
+
+    def resume(self, last_start: float, last_sum: float) -> None:
+        """Continues the sum of the statistics already imported, up to the hour starting at last_start"""
+        self.sum = last_sum
+        for hour in [hour for hour in self.pending if hour <= last_start]:
+            del self.pending[hour]
+
+    def drop_hours_before(self, timestamp: float) -> None:
+        """Forgets the pending hours too old to be backfilled, when they cannot be imported"""
+        for hour in [hour for hour in self.pending if hour < timestamp]:
+            del self.pending[hour]
+
+    def as_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "left_data": self.left_data,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "sum": self.sum,
+            "pending": [[hour, usage] for hour, usage in self.pending.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeviceUsage":
+        return cls(data["timestamp"], data["left_data"],
+                   dt_util.parse_datetime(data["start_date"]) if data.get("start_date") else None,
+                   data["sum"], {int(hour): usage for hour, usage in data.get("pending", [])})
+
+
+class ConsumptionStatistics:
+    """Data usage statistics of the devices of an entry, the state between refreshes is persisted"""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str):
+        self.hass = hass
+        self._entry_id = entry_id
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_STATISTICS.format(entry_id))
+        self._devices: dict[str, DeviceUsage] = {}
+        # devices whose sum was resumed from the recorder since the entry was loaded
+        self._resumed: set[str] = set()
+        self._owners: dict[str, str] = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_STATISTICS_OWNERS, {})
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = await self._store.async_load() or {}
+        for device_id, data in stored.get("devices", {}).items():
+            try:
+                self._devices[device_id] = DeviceUsage.from_dict(data)
+            except (KeyError, TypeError, ValueError) as err:
+                _LOGGER.warning("Ignoring stored usage of device %s: %s", device_id, err)
+
+    async def async_add_sample(self, device: Device, consumption: ConsumptionOfDevice, now: datetime) -> None:
+        """Adds the usage since the previous sample and imports the hours completed since"""
+        statistic_id = statistic_id_of(device.device_id)
+        if self._owners.setdefault(statistic_id, self._entry_id) != self._entry_id:
+            # imported by another entry of the account
+            return
+        usage = self._devices.get(device.device_id)
+        if usage is None:
+            # nothing is known of the usage before the first sample
+            self._devices[device.device_id] = DeviceUsage(now.timestamp(), consumption.left_data,
+                                                          consumption.start_date)
+        else:
+            usage.add_sample(consumption, now.timestamp())
+            if "recorder" in self.hass.config.components:
+                if device.device_id not in self._resumed:
+                    await self._async_resume(statistic_id, usage)
+                    self._resumed.add(device.device_id)
+                self._async_import(device, usage.completed_hours(now.timestamp()))
+            else:
+                usage.drop_hours_before(now.timestamp() - STATISTICS_MAX_BACKFILL_HOURS * HOUR_SECONDS)
+        self._store.async_delay_save(self._data_to_save, STATISTICS_SAVE_DELAY_SECONDS)
+
+    async def _async_resume(self, statistic_id: str, usage: DeviceUsage) -> None:
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, True, {"sum"})
+        rows = last.get(statistic_id)
+        if rows and rows[0].get("sum") is not None:
+            _LOGGER.debug("Resuming %s from the sum %s of %s", statistic_id, rows[0]["sum"], rows[0]["start"])
+            usage.resume(rows[0]["start"], rows[0]["sum"])
+
+    @callback
+    def _async_import(self, device: Device, statistics: list[StatisticData]) -> None:
+        if not statistics:
+            return
+        metadata = StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name=f"{device.tag} data used",
+            source=DOMAIN,
+            statistic_id=statistic_id_of(device.device_id),
+            unit_of_measurement=UnitOfInformation.MEGABYTES,
+        )
+        _LOGGER.debug("Importing %s hours of usage of device %s", len(statistics), device.device_id)
+        async_add_external_statistics(self.hass, metadata, statistics)
+
+    @callback
+    def forget_device(self, device_id: str) -> None:
+        # the statistics already imported are kept in the recorder
+        self._release(statistic_id_of(device_id))
+        self._resumed.discard(device_id)
+        if self._devices.pop(device_id, None) is not None:
+            self._store.async_delay_save(self._data_to_save, STATISTICS_SAVE_DELAY_SECONDS)
+
+    @callback
+    def release_devices(self) -> None:
+        """Lets another entry import the devices of this one, once it is unloaded"""
+        for statistic_id in [statistic_id for statistic_id, owner in self._owners.items() if owner == self._entry_id]:
+            self._release(statistic_id)
+        self._resumed.clear()
+
+    @callback
+    def _release(self, statistic_id: str) -> None:
+        if self._owners.get(statistic_id) == self._entry_id:
+            del self._owners[statistic_id]
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"devices": {device_id: usage.as_dict() for device_id, usage in self._devices.items()}}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -0,0 +1,144 @@
+"""Counters and latency histograms of the calls to the OBS API and of the refreshes.
+
+Kept in memory only, they are exposed through the diagnostics download and the diagnostic sensors.
+"""
+import time
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .const import LATENCY_BUCKETS_SECONDS, REFRESH_DURATION_BUCKETS_SECONDS, ENDPOINT_DEVICES
+
+
+class Histogram:
+    """Counts of the observed values per bucket, bounds are the inclusive upper limits of the buckets"""
+    __slots__ = ("bounds", "counts", "count", "total", "maximum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # the last bucket holds the values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def as_dict(self) -> dict:
+        buckets = {f"<={bound}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "max": round(self.maximum, 3),
+            "buckets": buckets,
+        }
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """Method and path of the call, with the device id replaced so the calls of all devices share a label"""
+    path = urlparse(url).path
+    if path.startswith(ENDPOINT_DEVICES + "/"):
+        device_path = path[len(ENDPOINT_DEVICES) + 1:]
+        _, _, endpoint = device_path.partition("/")
+        path = f"{ENDPOINT_DEVICES}/{{device_id}}" + (f"/{endpoint}" if endpoint else "")
+    return f"{method} {path}"
+
+
+class ApiMetrics:
+    """Calls of a client to the OBS API: latency and payload size per endpoint, retries and logins"""
+
+    def __init__(self):
+        self.latency: dict[str, Histogram] = {}
+        self.requests: Counter[str] = Counter()
+        # per HTTP status, "error" for the calls that got no response
+        self.statuses: Counter[str] = Counter()
+        self.payload_bytes: Counter[str] = Counter()
+        self.last_payload_bytes: dict[str, int] = {}
+        self.retries = 0
+        self.logins = 0
+        self.token_rejections = 0
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def record_request(self, endpoint: str, seconds: float, status: int | None) -> None:
+        self.requests[endpoint] += 1
+        self.statuses["error" if status is None else str(status)] += 1
+        histogram = self.latency.get(endpoint)
+        if histogram is None:
+            histogram = self.latency[endpoint] = Histogram(LATENCY_BUCKETS_SECONDS)
+        histogram.observe(seconds)
+
+    def record_payload(self, endpoint: str, size: int) -> None:
+        self.payload_bytes[endpoint] += size
+        self.last_payload_bytes[endpoint] = size
+
+    def as_dict(self) -> dict:
+        return {
+            "request_count": self.request_count,
+            "retries": self.retries,
+            "logins": self.logins,
+            "token_rejections": self.token_rejections,
+            "statuses": dict(self.statuses),
+            "endpoints": {
+                endpoint: {
+                    "requests": self.requests[endpoint],
+                    "latency_seconds": histogram.as_dict(),
+                    "payload_bytes_total": self.payload_bytes.get(endpoint, 0),
+                    "payload_bytes_last": self.last_payload_bytes.get(endpoint),
+                }
+                for endpoint, histogram in self.latency.items()
+            },
+        }
+
+
+class RefreshMetrics:
+    """Durations of the refreshes of a coordinator, in total and per phase"""
+
+    def __init__(self):
+        self.durations = Histogram(REFRESH_DURATION_BUCKETS_SECONDS)
+        self.count = 0
+        self.failures = 0
+        self.last_duration: float | None = None
+        self.last_phases: dict[str, float] = {}
+        self._phases: dict[str, float] = {}
+
+    @contextmanager
+    def measure_refresh(self) -> Iterator[None]:
+        self._phases = {}
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.failures += 1
+            raise
+        finally:
+            self.last_duration = time.perf_counter() - start
+            self.last_phases = self._phases
+            self.durations.observe(self.last_duration)
+            self.count += 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = time.perf_counter() - start
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "last_duration_seconds": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_phases_seconds": {name: round(seconds, 3) for name, seconds in self.last_phases.items()},
+            "duration_seconds": self.durations.as_dict(),
+        }
@@ -0,0 +1,129 @@
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from .const import (
+    RETRY_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS, CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_COOL_DOWN_SECONDS,
+)
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After header (delay in seconds or HTTP date) to a delay in seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter"""
+
+    def __init__(self, attempts: int = RETRY_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY_SECONDS,
+                 max_delay: float = RETRY_MAX_DELAY_SECONDS):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float | None:
+        """Delay before the retry following attempt (0 based), None when no retry should be done"""
+        if attempt + 1 >= self.attempts:
+            return None
+        if retry_after is not None:
+            # the provider asks for a longer pause than we are ready to wait, fail fast
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops calls to the API for a cool down period after repeated failures.
+
+    Once the cool down is over a single trial call is let through (half open): its success
+    closes the circuit, its failure opens it again. The other calls are refused while the trial
+    is in flight, unless it gave no outcome within a cool down (e.g. it was cancelled).
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cool_down: float = CIRCUIT_COOL_DOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.failure_count = 0
+        self._opened_at: float | None = None
+        self._trial_started_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CIRCUIT_CLOSED
+        if time.monotonic() - self._opened_at >= self.cool_down:
+            return CIRCUIT_HALF_OPEN
+        return CIRCUIT_OPEN
+
+    @property
+    def remaining_cool_down(self) -> float:
+        if self._opened_at is None:
+            return 0
+        return max(self.cool_down - (time.monotonic() - self._opened_at), 0)
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == CIRCUIT_CLOSED:
+            return True
+        if state == CIRCUIT_OPEN:
+            return False
+        now = time.monotonic()
+        if self._trial_started_at is not None and now - self._trial_started_at < self.cool_down:
+            return False
+        self._trial_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            _LOGGER.info("OBS API reachable again, circuit closed")
+        self.failure_count = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        self.failure_count += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failure_count >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                _LOGGER.warning("OBS API failing, calls suspended for %s seconds", self.cool_down)
+            self._opened_at = time.monotonic()
+            self._trial_started_at = None
+
+
+class TokenBucket:
+    """Allows bursts of capacity calls, refilled at rate tokens per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
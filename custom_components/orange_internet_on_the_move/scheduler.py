@@ -0,0 +1,75 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+from homeassistant.util import dt as dt_util
+
+from .log import get_logger
+from .const import (
+    NOMINAL_UPDATE_INTERVAL_SECONDS, IDLE_SAMPLES, LOW_DATA_RATIO, POLLS_BEFORE_EXPIRY,
+)
+from .dto import ConsumptionOfDevice
+
+_LOGGER = get_logger(__name__)
+
+
+class AdaptivePollScheduler:
+    """Computes the polling interval of each device from its plan state.
+
+    Idle or expired plans are polled less often, plans close to depletion or expiry more often,
+    always within [min_interval, max_interval]. The coordinator polls at the shortest interval
+    wanted by one of its devices.
+    """
+
+    def __init__(self, min_interval: timedelta, max_interval: timedelta):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._samples: dict[str, deque[int]] = {}
+        self._intervals: dict[str, timedelta] = {}
+
+    def _clamp(self, interval: timedelta) -> timedelta:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _idle_count(self, samples: deque[int]) -> int:
+        """Number of trailing samples equal to the last one"""
+        count = 0
+        for left_data in reversed(samples):
+            if left_data != samples[-1]:
+                break
+            count += 1
+        return count
+
+    def device_interval(self, device_id: str, consumption: ConsumptionOfDevice,
+                        now: datetime | None = None) -> timedelta:
+        now = now or dt_util.utcnow()
+        samples = self._samples.setdefault(device_id, deque(maxlen=2 * IDLE_SAMPLES))
+        samples.append(consumption.left_data)
+
+        if consumption.expiry_date <= now:
+            interval = self.max_interval
+        else:
+            interval = timedelta(seconds=NOMINAL_UPDATE_INTERVAL_SECONDS)
+
+            idle_count = self._idle_count(samples)
+            if idle_count >= IDLE_SAMPLES:
+                interval *= 2 ** (idle_count - IDLE_SAMPLES + 1)
+
+            if consumption.initial_data:
+                ratio = consumption.left_data / consumption.initial_data
+                if ratio < LOW_DATA_RATIO:
+                    interval = min(interval, timedelta(seconds=NOMINAL_UPDATE_INTERVAL_SECONDS) * ratio / LOW_DATA_RATIO)
+
+            interval = min(interval, (consumption.expiry_date - now) / POLLS_BEFORE_EXPIRY)
+
+        interval = self._clamp(interval)
+        self._intervals[device_id] = interval
+        _LOGGER.debug("Interval of device %s is %s", device_id, interval)
+        return interval
+
+    def forget_device(self, device_id: str) -> None:
+        self._samples.pop(device_id, None)
+        self._intervals.pop(device_id, None)
+
+    def next_interval(self) -> timedelta:
+        if not self._intervals:
+            return self._clamp(timedelta(seconds=NOMINAL_UPDATE_INTERVAL_SECONDS))
+        return min(self._intervals.values())
@@ -1,29 +1,49 @@
 """Platform for sensor integration."""
 from __future__ import annotations
 
-import logging
-from datetime import timedelta, datetime
-from math import floor
+import asyncio
+import contextlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
 
 from homeassistant.components.sensor import (
     SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import UnitOfInformation, PERCENTAGE
+from homeassistant.const import UnitOfInformation, UnitOfTime, PERCENTAGE, EntityCategory, Platform
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import ConfigEntryAuthFailed
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, CoordinatorEntity, UpdateFailed
+from homeassistant.util import dt as dt_util
 
-from .dto import ConsumptionOfDevice, Device, OBSFullData
-from .OBSHttpClient import ObsHttpClient, ApiAuthError
+from .dto import ConsumptionOfDevice, Device, OBSFullData, DeviceSnapshot
+from .OBSHttpClient import ObsHttpClient, ApiAuthError, ApiError, CircuitOpenError
 from .const import (
-    DOMAIN, ENDPOINT_HEADER_PROVIDER, )
-
-_LOGGER = logging.getLogger(__name__)
+    DOMAIN, ENDPOINT_HEADER_PROVIDER, CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS,
+    CONF_MIN_UPDATE_INTERVAL, DEFAULT_MIN_UPDATE_INTERVAL, CONF_MAX_UPDATE_INTERVAL, DEFAULT_MAX_UPDATE_INTERVAL,
+    REFRESH_TIMEOUT_SECONDS, DATA_ORIGIN_LIVE, DATA_ORIGIN_RESTORED, DATA_ORIGIN_STALE, DATA_COORDINATORS,
+    SERVICE_REFRESH_DEBOUNCE_SECONDS, CONF_USERNAME, CONF_DISABLED_SENSORS, EVENT_THRESHOLD,
+    GLOBAL_MAX_CONCURRENT_REQUESTS, )
+from .global_scheduler import async_get_global_scheduler
+from .history import ConsumptionHistoryStore
+from .last_data import LastDataStore
+from .long_term_statistics import ConsumptionStatistics
+from .log import get_logger
+from .metrics import RefreshMetrics
+from .resilience import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN
+from .scheduler import AdaptivePollScheduler
+from .single_flight import SingleFlight
+from .thresholds import ThresholdMonitor
+
+_LOGGER = get_logger(__name__)
 
 
 async def async_setup_entry(
@@ -31,235 +51,546 @@ async def async_setup_entry(
         entry: ConfigEntry,
         async_add_entities: AddEntitiesCallback
 ) -> None:
-    _LOGGER.info("Called async setup entry")
+    _LOGGER.debug("Called async setup entry")
     """Set up the sensor platform."""
 
     # assuming API object stored here by __init__.py
     obs_api = hass.data[DOMAIN][entry.entry_id]
-    obs_coordinator: OBSCoordinator = OBSCoordinator(hass, obs_api)
-
-    # Fetch initial data so we have data when entities subscribe
-    #
-    # If the refresh fails, async_config_entry_first_refresh will
-    # raise ConfigEntryNotReady and setup will try again later
-    #
-    # If you do not want to retry setup on failure, use
-    # coordinator.async_refresh() instead
-    #
-    _LOGGER.info("Calling async_config_entry_first_refresh")
-    await obs_coordinator.async_config_entry_first_refresh()
-
-    _LOGGER.info(f"async_add_entities with {obs_coordinator.data}")
-    new_devices = [
-        SensorDataBase(obs_coordinator, obs_coordinator.data),
-        StartDatePlanSensorEntity(obs_coordinator, obs_coordinator.data),
-        ExpiryDatePlanSensorEntity(obs_coordinator, obs_coordinator.data),
-        DataInitialSensorEntity(obs_coordinator, obs_coordinator.data),
-        DataLeftSensorEntity(obs_coordinator, obs_coordinator.data),
-        DataLeftPercentageSensorEntity(obs_coordinator, obs_coordinator.data),
-        PlanTypeSensorEntity(obs_coordinator, obs_coordinator.data)
-    ]
-    _LOGGER.info(f"async_add_entities new_devices={new_devices}")
-    if new_devices:
-        async_add_entities(new_devices)
-    _LOGGER.info("async_add_entities done")
-
-
-class SensorDataBase(CoordinatorEntity):
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        """Initialize the sensor."""
-        super().__init__(coordinator, context=obs_full_data)
-        self.device_consumption = obs_full_data.consumption
-        self.device = obs_full_data.device
-        self.id = self.device.device_id
+    obs_coordinator: OBSCoordinator = OBSCoordinator(hass, obs_api, entry.options, entry.entry_id)
+    # coordinators are looked up by the refresh service
+    coordinators = hass.data[DOMAIN].setdefault(DATA_COORDINATORS, {})
+    coordinators[entry.entry_id] = obs_coordinator
 
-    @property
-    def device_info(self) -> DeviceInfo:
-        """Return the device info."""
-        # return {"identifiers": {(DOMAIN, self.id)}}
-        return DeviceInfo(
-            identifiers={
-                # Serial numbers are unique identifiers within a specific domain
-                (DOMAIN, self.id)
-            },
-            name=f"Data Plan of {self.device.user_name} for {self.device.tag}",
-            manufacturer=f"Orange for {ENDPOINT_HEADER_PROVIDER}",
-            model=self.device.tag,
-            hw_version=self.device.serial_number
-        )
+    @callback
+    def forget_coordinator() -> None:
+        coordinators.pop(entry.entry_id, None)
+        obs_coordinator.statistics.release_devices()
+
+    entry.async_on_unload(forget_coordinator)
+
+    # entries refresh with their own phase offset instead of in lockstep
+    phase_offset = async_get_global_scheduler(hass).phase_offset(entry.entry_id)
+
+    if await obs_coordinator.async_restore():
+        # entities are created from the last good data, the first refresh runs in the background
+        _LOGGER.debug("Data restored, first refresh in the background in %s", phase_offset)
+
+        async def async_delayed_first_refresh() -> None:
+            await asyncio.sleep(phase_offset.total_seconds())
+            await obs_coordinator.async_refresh()
+
+        # cancelled if the entry is unloaded before it runs
+        entry.async_create_background_task(
+            hass, async_delayed_first_refresh(), f"{DOMAIN} first refresh {entry.entry_id}")
+    else:
+        # the next refreshes are shifted by the phase offset
+        obs_coordinator.phase_offset = phase_offset
+        # Fetch initial data so we have data when entities subscribe
+        #
+        # If the refresh fails, async_config_entry_first_refresh will
+        # raise ConfigEntryNotReady and setup will try again later
+        #
+        _LOGGER.debug("Calling async_config_entry_first_refresh")
+        await obs_coordinator.async_config_entry_first_refresh()
+
+    disabled_sensors = set(entry.options.get(CONF_DISABLED_SENSORS, []))
+    descriptions = tuple(description for description in SENSOR_DESCRIPTIONS if description.key not in disabled_sensors)
+    _async_remove_disabled_entities(hass, obs_coordinator, disabled_sensors)
+
+    known_device_ids: set[str] = set()
 
+    @callback
+    def add_new_devices() -> None:
+        """Create the sensor set of every device not seen before"""
+        new_devices = []
+        for device_id, obs_full_data in obs_coordinator.data.items():
+            if device_id in known_device_ids:
+                continue
+            known_device_ids.add(device_id)
+            new_devices.extend(build_device_entities(obs_coordinator, obs_full_data, descriptions))
+        _LOGGER.debug("async_add_entities %s new entities", len(new_devices))
+        if new_devices:
+            async_add_entities(new_devices)
+
+    add_new_devices()
+    async_add_entities([
+        CircuitBreakerSensorEntity(obs_coordinator, entry),
+        RefreshDurationSensorEntity(obs_coordinator, entry),
+        ApiCallCountSensorEntity(obs_coordinator, entry),
+    ])
+    entry.async_on_unload(obs_coordinator.async_add_listener(add_new_devices))
+    _LOGGER.debug("async_add_entities done")
+
+
+@callback
+def _async_remove_disabled_entities(hass: HomeAssistant, obs_coordinator: OBSCoordinator,
+                                    disabled_sensors: set[str]) -> None:
+    """Sensors disabled in the options are removed from the entity registry"""
+    entity_registry = er.async_get(hass)
+    for device_id in obs_coordinator.data:
+        for key in disabled_sensors:
+            entity_id = entity_registry.async_get_entity_id(Platform.SENSOR, DOMAIN, f"{device_id}_{key}")
+            if entity_id is not None:
+                entity_registry.async_remove(entity_id)
+
+
+@dataclass(frozen=True, kw_only=True)
+class OBSSensorEntityDescription(SensorEntityDescription):
+    """Sensor of a device, its value read from the DeviceSnapshot of the refresh"""
+    value_fn: Callable[[DeviceSnapshot], Any]
+    # fields of DeviceSnapshot the state and attributes depend on, the state is written when one changed
+    snapshot_fields: tuple[str, ...]
+    attributes_fn: Callable[[DeviceSnapshot], dict] | None = None
+
+
+SENSOR_DESCRIPTIONS: tuple[OBSSensorEntityDescription, ...] = (
+    OBSSensorEntityDescription(
+        key="start_date",
+        name="Start date",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda snapshot: snapshot.start_date,
+        snapshot_fields=("start_date",),
+    ),
+    OBSSensorEntityDescription(
+        key="expiry_date",
+        name="Expiry date",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda snapshot: snapshot.expiry_date,
+        snapshot_fields=("expiry_date",),
+    ),
+    OBSSensorEntityDescription(
+        key="initial_data",
+        name="Initial Data",
+        native_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda snapshot: snapshot.initial_data_mb,
+        snapshot_fields=("initial_data_mb",),
+    ),
+    OBSSensorEntityDescription(
+        key="left_data",
+        name="Left data",
+        native_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda snapshot: snapshot.left_data_mb,
+        snapshot_fields=("left_data_mb",),
+    ),
+    OBSSensorEntityDescription(
+        key="left_data_percentage",
+        name="Left data percentage",
+        native_unit_of_measurement=PERCENTAGE,
+        icon="mdi:gauge",
+        value_fn=lambda snapshot: snapshot.left_data_percentage,
+        snapshot_fields=("left_data_percentage",),
+    ),
+    OBSSensorEntityDescription(
+        key="plan_type",
+        name="Plan Type",
+        icon="mdi:file-sign",
+        value_fn=lambda snapshot: snapshot.plan_type,
+        snapshot_fields=("plan_type",),
+    ),
+    OBSSensorEntityDescription(
+        key="burn_rate",
+        name="Burn rate",
+        native_unit_of_measurement="MB/h",
+        state_class=SensorStateClass.MEASUREMENT,
+        icon="mdi:fire",
+        value_fn=lambda snapshot: snapshot.burn_rate_mb_per_hour,
+        snapshot_fields=("burn_rate_mb_per_hour",),
+    ),
+    OBSSensorEntityDescription(
+        key="average_daily_usage",
+        name="Average daily usage",
+        native_unit_of_measurement="MB/d",
+        state_class=SensorStateClass.MEASUREMENT,
+        icon="mdi:chart-line",
+        value_fn=lambda snapshot: snapshot.average_daily_usage_mb,
+        snapshot_fields=("average_daily_usage_mb",),
+    ),
+    OBSSensorEntityDescription(
+        key="depletion_date",
+        name="Projected depletion date",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda snapshot: snapshot.depletion_date,
+        snapshot_fields=("depletion_date", "expiry_date"),
+        attributes_fn=lambda snapshot: {"depletes_before_expiry": snapshot.depletes_before_expiry},
+    ),
+    OBSSensorEntityDescription(
+        key="subscription",
+        name="Subscription",
+        icon="mdi:card-account-details",
+        value_fn=lambda snapshot: snapshot.subscription_name,
+        snapshot_fields=("subscription_name", "subscription_status", "subscription_start_date"),
+        attributes_fn=lambda snapshot: {"status": snapshot.subscription_status,
+                                        "start_date": snapshot.subscription_start_date},
+    ),
+    OBSSensorEntityDescription(
+        key="subscription_expiry_date",
+        name="Subscription expiry date",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda snapshot: snapshot.subscription_expiry_date,
+        snapshot_fields=("subscription_expiry_date",),
+    ),
+)
 
-class DataLeftPercentageSensorEntity(SensorEntity, SensorDataBase):
 
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DataSensorEntity with {obs_full_data}")
-        """Pass coordinator to CoordinatorEntity."""
+def build_device_entities(obs_coordinator: OBSCoordinator, obs_full_data: OBSFullData,
+                          descriptions: tuple[OBSSensorEntityDescription, ...]) -> list[OBSSensorEntity]:
+    device_info = device_info_of(obs_full_data.device)
+    return [OBSSensorEntity(obs_coordinator, obs_full_data.device.device_id, device_info, description)
+            for description in descriptions]
+
+
+def device_info_of(device: Device) -> DeviceInfo:
+    return DeviceInfo(
+        identifiers={
+            # Serial numbers are unique identifiers within a specific domain
+            (DOMAIN, device.device_id)
+        },
+        name=f"Data Plan of {device.user_name} for {device.tag}",
+        manufacturer=f"Orange for {ENDPOINT_HEADER_PROVIDER}",
+        model=device.tag,
+        hw_version=device.serial_number
+    )
+
+
+class OBSSensorEntity(CoordinatorEntity, SensorEntity):
+    """Sensor of a device driven by its description, the state is only written when it changed"""
+    entity_description: OBSSensorEntityDescription
+    # the description name is scoped to the device, e.g. "Data Plan of ... for Car Left data"
+    _attr_has_entity_name = True
+
+    def __init__(self, coordinator, device_id: str, device_info: DeviceInfo,
+                 description: OBSSensorEntityDescription):
+        super().__init__(coordinator, context=device_id)
+        self.entity_description = description
+        self.id = device_id
+        self._attr_unique_id = f"{device_id}_{description.key}"
+        self._attr_device_info = device_info
+        self._last_written_status: tuple[bool, str] | None = None
+        snapshot = coordinator.snapshots.get(device_id)
+        if snapshot is not None:
+            self._attr_native_value = description.value_fn(snapshot)
 
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Left data percentage"
-        self._attr_unique_id = f"{self.id}_left_data_percentage"
-        self._attr_native_unit_of_measurement = PERCENTAGE
-        self._attr_icon = "mdi:gauge"
-        self._attr_native_value = floor(
-            obs_full_data.consumption.left_data / obs_full_data.consumption.initial_data * 100)
+    @property
+    def available(self) -> bool:
+        """A device missing from the data is unavailable, a failed refresh keeps the last data (stale)"""
+        return self.id in self.coordinator.data
 
-    @callback
-    def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
-        new_state_value = floor(
-            self.coordinator.data.consumption.left_data / self.coordinator.data.consumption.initial_data * 100)
-        _LOGGER.info(
-            f"DataConsumedSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
-
-
-class DataLeftSensorEntity(SensorEntity, SensorDataBase):
-
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DataLeftSensorEntity with {obs_full_data}")
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Left data"
-        self._attr_unique_id = f"{self.id}_left_data"
-        self._attr_native_unit_of_measurement = UnitOfInformation.MEGABYTES
-        self._attr_device_class = SensorDeviceClass.DATA_SIZE
-        self._attr_state_class = SensorStateClass.MEASUREMENT
-        self._attr_native_value = obs_full_data.consumption.left_data / 1024
+    @property
+    def extra_state_attributes(self) -> dict:
+        attributes = {"data_origin": self.coordinator.data_origin}
+        snapshot = self.coordinator.snapshots.get(self.id)
+        if snapshot is not None and self.entity_description.attributes_fn is not None:
+            attributes.update(self.entity_description.attributes_fn(snapshot))
+        return attributes
+
+    def _status(self) -> tuple[bool, str]:
+        return self.available, self.coordinator.data_origin
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        new_state_value = self.coordinator.data.consumption.left_data / 1024
-        _LOGGER.info(
-            f"DataConsumedSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
-
-
-class DataInitialSensorEntity(SensorEntity, SensorDataBase):
-
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DataSensorEntity with {obs_full_data}")
-        """Pass coordinator to CoordinatorEntity."""
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Initial Data"
-        self._attr_unique_id = f"{self.id}_initial_data"
-        self._attr_native_unit_of_measurement = UnitOfInformation.MEGABYTES
-        self._attr_device_class = SensorDeviceClass.DATA_SIZE
-        self._attr_state_class = SensorStateClass.MEASUREMENT
-        self._attr_native_value = obs_full_data.consumption.initial_data / 1024
+        changed = self._status() != self._last_written_status
+        snapshot = self.coordinator.snapshots.get(self.id)
+        if snapshot is not None and not snapshot.changed.isdisjoint(self.entity_description.snapshot_fields):
+            new_state_value = self.entity_description.value_fn(snapshot)
+            _LOGGER.debug("%s _handle_coordinator_update previous : %s new %s", self._attr_unique_id,
+                          self._attr_native_value, new_state_value)
+            self._attr_native_value = new_state_value
+            changed = True
+        if changed:
+            self.async_write_ha_state()
 
     @callback
-    def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
-        new_state_value = self.coordinator.data.consumption.initial_data / 1024
-        _LOGGER.info(
-            f"DataSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
+    def async_write_ha_state(self) -> None:
+        self._last_written_status = self._status()
+        super().async_write_ha_state()
 
 
-class StartDatePlanSensorEntity(SensorEntity, SensorDataBase):
+class CircuitBreakerSensorEntity(CoordinatorEntity, SensorEntity):
+    """State of the circuit breaker guarding the calls to the OBS API of the account"""
 
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DatePlanSensorEntity with {obs_full_data}")
-        """Pass coordinator to CoordinatorEntity."""
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Start date"
-        self._attr_unique_id = f"{self.id}_start_date"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_native_value = datetime.fromisoformat(obs_full_data.consumption.start_date)
+    def __init__(self, coordinator, entry: ConfigEntry):
+        super().__init__(coordinator)
+        self._attr_name = "Orange Internet on the move API circuit"
+        self._attr_unique_id = f"{entry.entry_id}_circuit_breaker"
+        self._attr_device_class = SensorDeviceClass.ENUM
+        self._attr_options = [CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN]
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_icon = "mdi:electric-switch"
 
-    @callback
-    def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
-        new_state_value = datetime.fromisoformat(self.coordinator.data.consumption.start_date)
-        _LOGGER.info(
-            f"StartDatePlanSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
+    @property
+    def available(self) -> bool:
+        # the circuit state is meaningful precisely when refreshes fail
+        return True
 
+    @property
+    def native_value(self) -> str:
+        return self.coordinator.obs_api_client.circuit_breaker.state
 
-class ExpiryDatePlanSensorEntity(SensorEntity, SensorDataBase):
+    @property
+    def extra_state_attributes(self) -> dict:
+        circuit_breaker = self.coordinator.obs_api_client.circuit_breaker
+        return {
+            "failure_count": circuit_breaker.failure_count,
+            "remaining_cool_down": round(circuit_breaker.remaining_cool_down),
+        }
+
+
+class RefreshDurationSensorEntity(CoordinatorEntity, SensorEntity):
+    """Duration of the last refresh of the account, disabled by default"""
+
+    def __init__(self, coordinator, entry: ConfigEntry):
+        super().__init__(coordinator)
+        self._attr_name = "Orange Internet on the move last refresh duration"
+        self._attr_unique_id = f"{entry.entry_id}_last_refresh_duration"
+        self._attr_device_class = SensorDeviceClass.DURATION
+        self._attr_state_class = SensorStateClass.MEASUREMENT
+        self._attr_native_unit_of_measurement = UnitOfTime.SECONDS
+        self._attr_suggested_display_precision = 2
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_entity_registry_enabled_default = False
 
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DatePlanSensorEntity with {obs_full_data}")
-        """Pass coordinator to CoordinatorEntity."""
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Expiry date"
-        self._attr_unique_id = f"{self.id}_expiry_date"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_native_value = datetime.fromisoformat(obs_full_data.consumption.expiry_date)
+    @property
+    def available(self) -> bool:
+        return self.coordinator.refresh_metrics.last_duration is not None
 
-    @callback
-    def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
-        new_state_value = datetime.fromisoformat(self.coordinator.data.consumption.expiry_date)
-        _LOGGER.info(
-            f"ExpiryDatePlanSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
+    @property
+    def native_value(self) -> float | None:
+        return self.coordinator.refresh_metrics.last_duration
 
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {f"{name}_duration": round(seconds, 3)
+                for name, seconds in self.coordinator.refresh_metrics.last_phases.items()}
 
-class PlanTypeSensorEntity(SensorEntity, SensorDataBase):
 
-    def __init__(self, coordinator, obs_full_data: OBSFullData):
-        _LOGGER.info(f"Creating DatePlanSensorEntity with {obs_full_data}")
-        """Pass coordinator to CoordinatorEntity."""
-        super().__init__(coordinator, obs_full_data)
-        self._attr_name = "Plan Type"
-        self._attr_unique_id = f"{self.id}_plan_type"
-        self._attr_native_value = obs_full_data.consumption.type
-        self._attr_icon = "mdi:file-sign"
+class ApiCallCountSensorEntity(CoordinatorEntity, SensorEntity):
+    """Calls made to the OBS API by the client of the account since Home Assistant started, disabled by default"""
 
-    @callback
-    def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
-        new_state_value = self.coordinator.data.consumption.type
-        _LOGGER.info(
-            f"PlanTypeSensorEntity _handle_coordinator_update previous : {self._attr_native_value} new {new_state_value}")
-        self._attr_native_value = new_state_value
-        self.async_write_ha_state()
+    def __init__(self, coordinator, entry: ConfigEntry):
+        super().__init__(coordinator)
+        self._attr_name = "Orange Internet on the move API calls"
+        self._attr_unique_id = f"{entry.entry_id}_api_call_count"
+        self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_entity_registry_enabled_default = False
+        self._attr_icon = "mdi:counter"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @property
+    def native_value(self) -> int:
+        return self.coordinator.obs_api_client.metrics.request_count
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        metrics = self.coordinator.obs_api_client.metrics
+        return {"retries": metrics.retries, "logins": metrics.logins, "token_rejections": metrics.token_rejections}
 
 
-class OBSCoordinator(DataUpdateCoordinator[OBSFullData]):
-    """A coordinator to fetch data from the api only once"""
+class OBSCoordinator(DataUpdateCoordinator[dict[str, OBSFullData]]):
+    """A coordinator to fetch data from the api only once, for every device of the account"""
 
-    def __init__(self, hass, obs_api_client: ObsHttpClient):
+    def __init__(self, hass, obs_api_client: ObsHttpClient, options, entry_id: str):
         """Initialize my coordinator."""
+        self.scheduler = AdaptivePollScheduler(
+            min_interval=timedelta(minutes=options.get(CONF_MIN_UPDATE_INTERVAL, DEFAULT_MIN_UPDATE_INTERVAL)),
+            max_interval=timedelta(minutes=options.get(CONF_MAX_UPDATE_INTERVAL, DEFAULT_MAX_UPDATE_INTERVAL)),
+        )
         super().__init__(
             hass,
             _LOGGER,
             # Name of the data. For logging purposes.
             name="Orange Internet on the move sensor",
-            update_interval=timedelta(seconds=3600),
+            update_interval=self.scheduler.next_interval(),
         )
         self.obs_api_client: ObsHttpClient = obs_api_client
+        # precomputed sensor values of each device, rebuilt once per refresh
+        self.snapshots: dict[str, DeviceSnapshot] = {}
+        self.history = ConsumptionHistoryStore(hass, entry_id)
+        self.statistics = ConsumptionStatistics(hass, entry_id)
+        self.last_data = LastDataStore(hass, entry_id)
+        self.thresholds = ThresholdMonitor(hass, entry_id, options)
+        self._entry_id = entry_id
+        self.refresh_metrics = RefreshMetrics()
+        self._pending_events: list[dict] = []
+        # True while the data comes from storage and no refresh succeeded yet
+        self.restored = False
+        self._on_demand_refresh = SingleFlight(SERVICE_REFRESH_DEBOUNCE_SECONDS)
+        # added once to the next interval, to put the refreshes of the entry in its phase
+        self.phase_offset = timedelta(0)
+        self._consumption_semaphore = asyncio.Semaphore(
+            # options saved before the range was bounded by the global cap
+            min(options.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS),
+                GLOBAL_MAX_CONCURRENT_REQUESTS))
 
-    async def _async_update_data(self) -> OBSFullData:
+    @property
+    def data_origin(self) -> str:
+        if not self.last_update_success:
+            return DATA_ORIGIN_STALE
+        return DATA_ORIGIN_RESTORED if self.restored else DATA_ORIGIN_LIVE
+
+    async def async_restore(self) -> bool:
+        """Load the last good data from storage, without any network call"""
+        data = await self.last_data.async_load()
+        if not data:
+            return False
+        # the sensors computed from the history are restored too
+        await self.history.async_load()
+        self._build_snapshots(data, {})
+        self.data = data
+        self.restored = True
+        return True
+
+    async def async_request_fresh_data(self) -> bool:
+        """On demand refresh: calls close together share one refresh, limited per account.
+
+        Returns whether a refresh happened and succeeded.
+        """
+        return await self._on_demand_refresh.run("refresh", self._async_on_demand_refresh)
+
+    async def _async_on_demand_refresh(self) -> bool:
+        await asyncio.sleep(SERVICE_REFRESH_DEBOUNCE_SECONDS)
+        if not self.obs_api_client.refresh_bucket.try_acquire():
+            _LOGGER.warning("Too many refresh requests for %s, current data returned",
+                            self.obs_api_client.config[CONF_USERNAME])
+            return False
+        await self.async_refresh()
+        return self.last_update_success
+
+    async def _async_fetch_device(self, device: Device) -> OBSFullData:
+        async with self._consumption_semaphore:
+            consumption_info: ConsumptionOfDevice = \
+                await self.obs_api_client.get_consumption_of_device(device=device)
+            _LOGGER.debug("Consumption fetched for %s : %s", device.device_id, consumption_info)
+            # served from the client cache most of the time, refreshed on its own slow schedule
+            try:
+                subscription = await self.obs_api_client.get_subscription_of_device(device=device)
+            except ApiError as err:
+                _LOGGER.debug("Error fetching subscription of device %s: %s", device.device_id, err)
+                previous = (self.data or {}).get(device.device_id)
+                subscription = previous.subscription if previous is not None else None
+        return OBSFullData(device=device, consumption=consumption_info, subscription=subscription)
+
+    async def _async_fetch_devices(self) -> tuple[list[Device], list[OBSFullData | BaseException]]:
+        """Devices of the account and their data, each device is fetched as soon as the list yields it"""
+        devices: list[Device] = []
+        tasks: list[asyncio.Future] = []
+        try:
+            with self.refresh_metrics.phase("devices"):
+                async with contextlib.aclosing(self.obs_api_client.async_iter_devices()) as streamed:
+                    async for device in streamed:
+                        devices.append(device)
+                        tasks.append(asyncio.ensure_future(self._async_fetch_device(device)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        _LOGGER.debug("Devices fetched : %s", devices)
+        # devices still being fetched once the list is complete
+        with self.refresh_metrics.phase("device_data"):
+            return devices, await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _async_update_data(self) -> dict[str, OBSFullData]:
+        with self.refresh_metrics.measure_refresh():
+            return await self._async_refresh_data()
+
+    async def _async_refresh_data(self) -> dict[str, OBSFullData]:
         _LOGGER.debug("Starting collecting data")
 
-        # return ConsumptionOfDevice("pipo", 3145728, 2411724, 1234, 1234)
-
         """Fetch data from API endpoint.
 
         This is the place to pre-process the data to lookup tables
         so entities can quickly look up their data.
         """
         try:
-            await self.obs_api_client.authenticate_and_store_token()
-            first_device: Device = await self.obs_api_client.get_first_device_info()
-            _LOGGER.debug(f"First device fetched : {first_device}")
-            consumption_info: ConsumptionOfDevice = \
-                await self.obs_api_client.get_consumption_of_device(device=first_device)
-            _LOGGER.debug(f"Consumption fetched : {consumption_info}")
-
-            return OBSFullData(device=first_device, consumption=consumption_info)
+            await self.history.async_load()
+            await self.statistics.async_load()
+            await self.thresholds.async_load()
+            # overall deadline of the refresh, each request also has its own
+            async with asyncio.timeout(REFRESH_TIMEOUT_SECONDS):
+                with self.refresh_metrics.phase("token"):
+                    await self.obs_api_client.async_ensure_token()
+                devices, results = await self._async_fetch_devices()
         except ApiAuthError as err:
             # Raising ConfigEntryAuthFailed will cancel future updates
             # and start a config flow with SOURCE_REAUTH (async_step_reauth)
             raise ConfigEntryAuthFailed from err
-        # except ApiError as err:
-        #     raise UpdateFailed(f"Error communicating with API: {err}")
+        except CircuitOpenError as err:
+            raise UpdateFailed(str(err))
+        except asyncio.TimeoutError:
+            raise UpdateFailed(f"Refresh took more than {REFRESH_TIMEOUT_SECONDS} seconds")
         except Exception as err:
             raise UpdateFailed(f"Error communicating with API: {err}")
+
+        previous_data = self.data or {}
+        now = dt_util.utcnow()
+        data: dict[str, OBSFullData] = {}
+        fetched_device_ids: list[str] = []
+        for device, result in zip(devices, results):
+            if isinstance(result, ApiAuthError):
+                raise ConfigEntryAuthFailed from result
+            if isinstance(result, Exception):
+                # a broken device does not fail the whole refresh, its last known data is kept
+                _LOGGER.warning("Error fetching consumption of device %s: %s", device.device_id, result)
+                if isinstance(result, ApiError) and result.status == 404:
+                    # the device list is outdated, fetch it again on the next refresh
+                    self.obs_api_client.invalidate_devices()
+                if device.device_id in previous_data:
+                    data[device.device_id] = previous_data[device.device_id]
+                continue
+            data[device.device_id] = result
+            fetched_device_ids.append(device.device_id)
+            self.scheduler.device_interval(device.device_id, result.consumption, now)
+            self.history.add_sample(device.device_id, result.consumption, now)
+            try:
+                await self.statistics.async_add_sample(device, result.consumption, now)
+            except Exception as err:
+                # the statistics are a side feature, the data fetched is kept
+                _LOGGER.warning("Error importing the statistics of device %s: %s", device.device_id, err)
+
+        if devices and not data:
+            raise UpdateFailed("Error communicating with API: no device consumption could be fetched")
+
+        for device_id in previous_data.keys() - data.keys():
+            self.scheduler.forget_device(device_id)
+            self.history.forget_device(device_id)
+            self.statistics.forget_device(device_id)
+            self.thresholds.forget_device(device_id)
+        self._build_snapshots(data, previous_data)
+        for device_id in fetched_device_ids:
+            self._pending_events.extend(self.thresholds.evaluate(self.snapshots[device_id], now))
+        self.restored = False
+        self.last_data.async_save(data)
+        # the next refresh is scheduled with this interval once this update returns
+        self.update_interval = self.scheduler.next_interval() + self.phase_offset
+        self.phase_offset = timedelta(0)
+        _LOGGER.debug("Next refresh in %s", self.update_interval)
+        return data
+
+    @callback
+    def async_update_listeners(self) -> None:
+        super().async_update_listeners()
+        # threshold events are fired once the entities carry the new values
+        events, self._pending_events = self._pending_events, []
+        for event in events:
+            self.hass.bus.async_fire(EVENT_THRESHOLD, {"config_entry_id": self._entry_id, **event})
+
+    def _build_snapshots(self, data: dict[str, OBSFullData], previous_data: dict[str, OBSFullData]) -> None:
+        snapshots: dict[str, DeviceSnapshot] = {}
+        for device_id, obs_full_data in data.items():
+            previous_snapshot = self.snapshots.get(device_id)
+            if previous_snapshot is not None and previous_data.get(device_id) is obs_full_data:
+                # data kept from a previous refresh, nothing changed
+                snapshots[device_id] = previous_snapshot.unchanged()
+            else:
+                snapshots[device_id] = DeviceSnapshot.from_full_data(
+                    obs_full_data, previous_snapshot, self.history.get(device_id))
+        self.snapshots = snapshots
@@ -0,0 +1,73 @@
+import asyncio
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, device_registry as dr
+
+from .const import DOMAIN, DATA_COORDINATORS, SERVICE_REFRESH, ATTR_DEVICE_ID, ATTR_CONFIG_ENTRY_ID
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+REFRESH_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_DEVICE_ID): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(ATTR_CONFIG_ENTRY_ID): vol.All(cv.ensure_list, [cv.string]),
+})
+
+
+def _resolve_targets(hass: HomeAssistant, call: ServiceCall) -> dict[str, set[str] | None]:
+    """Entry ids to refresh, with the OBS device ids to return (None for every device)"""
+    coordinators = hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {})
+    targets: dict[str, set[str] | None] = {}
+    for entry_id in call.data.get(ATTR_CONFIG_ENTRY_ID, []):
+        if entry_id not in coordinators:
+            raise HomeAssistantError(f"Unknown or unloaded config entry {entry_id}")
+        targets[entry_id] = None
+
+    device_registry = dr.async_get(hass)
+    for device_id in call.data.get(ATTR_DEVICE_ID, []):
+        device_entry = device_registry.async_get(device_id)
+        if device_entry is None:
+            raise HomeAssistantError(f"Unknown device {device_id}")
+        obs_device_ids = {identifier for domain, identifier in device_entry.identifiers if domain == DOMAIN}
+        entry_ids = [entry_id for entry_id in device_entry.config_entries if entry_id in coordinators]
+        if not obs_device_ids or not entry_ids:
+            raise HomeAssistantError(f"Device {device_id} is not an {DOMAIN} device")
+        for entry_id in entry_ids:
+            if entry_id in targets and targets[entry_id] is None:
+                continue
+            targets.setdefault(entry_id, set()).update(obs_device_ids)
+
+    if not targets:
+        targets = {entry_id: None for entry_id in coordinators}
+    return targets
+
+
+async def _async_refresh(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    targets = _resolve_targets(hass, call)
+    coordinators = hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {})
+    # each refresh waits for its debounce, the entries are refreshed together
+    refreshed = await asyncio.gather(
+        *(coordinators[entry_id].async_request_fresh_data() for entry_id in targets))
+    response = {}
+    for (entry_id, device_ids), entry_refreshed in zip(targets.items(), refreshed):
+        coordinator = coordinators[entry_id]
+        response[entry_id] = {
+            "refreshed": entry_refreshed,
+            "data_origin": coordinator.data_origin,
+            "devices": {device_id: snapshot.as_dict()
+                        for device_id, snapshot in coordinator.snapshots.items()
+                        if device_ids is None or device_id in device_ids},
+        }
+    return response
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Registered once by async_setup, the service acts on the entries loaded when called"""
+
+    async def async_handle_refresh(call: ServiceCall) -> ServiceResponse:
+        return await _async_refresh(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_REFRESH, async_handle_refresh, schema=REFRESH_SCHEMA,
+                                 supports_response=SupportsResponse.OPTIONAL)
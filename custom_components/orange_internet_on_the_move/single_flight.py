@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from typing import Any
+
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    # avoids "exception was never retrieved" when every waiter has been cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+class _Feed:
+    """Items of a streamed call in flight, read by each caller at its own pace"""
+    __slots__ = ("items", "changed")
+
+    def __init__(self):
+        self.items: list = []
+        self.changed = asyncio.Event()
+
+    def append(self, item: Any) -> None:
+        self.items.append(item)
+        self.changed.set()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into one execution.
+
+    Callers arriving while a call is in flight await the same task; a successful result is
+    also served to callers arriving within freshness (or the ttl of the key) seconds after it
+    completed, which makes it the per endpoint cache of the client.
+    """
+
+    def __init__(self, freshness: float):
+        self.freshness = freshness
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._results: dict[Hashable, tuple[float, Any]] = {}
+        self._feeds: dict[Hashable, _Feed] = {}
+
+    def forget(self, key: Hashable | None = None) -> None:
+        if key is None:
+            self._results.clear()
+        else:
+            self._results.pop(key, None)
+
+    def cached(self, key: Hashable, ttl: float | None = None) -> Any | None:
+        """Completed result of key still fresh, None when there is none"""
+        cached = self._results.get(key)
+        return cached[1] if self._is_fresh(cached, ttl) else None
+
+    def remember(self, key: Hashable, result: Any) -> None:
+        """Stores a result obtained outside of run, served like the result of a completed call"""
+        self._results[key] = (time.monotonic(), result)
+
+    def _is_fresh(self, cached: tuple[float, Any] | None, ttl: float | None) -> bool:
+        return cached is not None and time.monotonic() - cached[0] < (self.freshness if ttl is None else ttl)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]], fresh: bool = True,
+                  ttl: float | None = None) -> Any:
+        """Result of factory for key.
+
+        fresh=False disables the reuse of a completed result, ttl overrides the freshness window
+        for this key (slowly changing endpoints are cached longer).
+        """
+        if fresh:
+            cached = self._results.get(key)
+            if self._is_fresh(cached, ttl):
+                _LOGGER.debug("Reusing result of %s", key)
+                return cached[1]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._start(key, factory)
+        else:
+            _LOGGER.debug("Joining in flight call %s", key)
+        # a cancelled caller must not cancel the call shared with the others
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]], fresh: bool = True,
+                     ttl: float | None = None) -> AsyncIterator[Any]:
+        """Items of the iterator of factory for key, yielded as soon as they are produced.
+
+        Concurrent callers share one iteration, each one reads all its items. The list of the items
+        is the result of the call: it is cached, and served to callers of run with the same key.
+        """
+        if fresh:
+            cached = self._results.get(key)
+            if self._is_fresh(cached, ttl):
+                _LOGGER.debug("Reusing result of %s", key)
+                for item in cached[1]:
+                    yield item
+                return
+
+        task = self._in_flight.get(key)
+        feed = self._feeds.get(key)
+        if task is None:
+            feed = self._feeds[key] = _Feed()
+
+            async def collect() -> list:
+                async with contextlib.aclosing(factory()) as items:
+                    async for item in items:
+                        feed.append(item)
+                return feed.items
+
+            task = self._start(key, collect)
+            task.add_done_callback(lambda _: feed.changed.set())
+        elif feed is None:
+            # in flight through run, its items come all at once
+            _LOGGER.debug("Joining in flight call %s", key)
+            for item in await asyncio.shield(task):
+                yield item
+            return
+        else:
+            _LOGGER.debug("Joining in flight stream %s", key)
+
+        index = 0
+        while True:
+            if index < len(feed.items):
+                yield feed.items[index]
+                index += 1
+            elif task.done():
+                # raises the failure of the call, once the items produced before it are read
+                task.result()
+                return
+            else:
+                feed.changed.clear()
+                await feed.changed.wait()
+
+    def _start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(factory())
+        task.add_done_callback(_consume_result)
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._on_done(key, done))
+        return task
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._feeds.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._results[key] = (time.monotonic(), task.result())
@@ -0,0 +1,112 @@
+from collections.abc import Mapping
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    STORAGE_VERSION, STORAGE_KEY_THRESHOLDS, CONF_THRESHOLD_LEFT_PERCENTAGE, DEFAULT_THRESHOLD_LEFT_PERCENTAGE,
+    CONF_THRESHOLD_LEFT_MB, DEFAULT_THRESHOLD_LEFT_MB, CONF_THRESHOLD_EXPIRY_DAYS, DEFAULT_THRESHOLD_EXPIRY_DAYS,
+    HYSTERESIS_LEFT_PERCENTAGE, HYSTERESIS_LEFT_MB_RATIO, HYSTERESIS_EXPIRY_DAYS, HISTORY_SAVE_DELAY_SECONDS,
+)
+from .dto import DeviceSnapshot
+from .log import get_logger
+
+_LOGGER = get_logger(__name__)
+
+THRESHOLD_LEFT_PERCENTAGE = "left_data_percentage"
+THRESHOLD_LEFT_MB = "left_data"
+THRESHOLD_EXPIRY = "expiry"
+THRESHOLD_PLAN_TYPE = "plan_type"
+
+STATE_TRIGGERED = "triggered"
+STATE_CLEARED = "cleared"
+STATE_CHANGED = "changed"
+
+
+class ThresholdMonitor:
+    """Edge triggered threshold alerts evaluated on the snapshots of each refresh.
+
+    An alert triggers when the value goes down to its threshold and clears once the value is
+    back above threshold + hysteresis, so a value oscillating around the threshold does not
+    flap. Active alerts are persisted so a restart does not fire them again.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, options: Mapping):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_THRESHOLDS.format(entry_id))
+        # (threshold, clear value) by threshold type, in the unit of the threshold
+        self._thresholds: dict[str, tuple[float, float]] = {}
+        left_percentage = options.get(CONF_THRESHOLD_LEFT_PERCENTAGE, DEFAULT_THRESHOLD_LEFT_PERCENTAGE)
+        if left_percentage:
+            self._thresholds[THRESHOLD_LEFT_PERCENTAGE] = (left_percentage, left_percentage + HYSTERESIS_LEFT_PERCENTAGE)
+        left_mb = options.get(CONF_THRESHOLD_LEFT_MB, DEFAULT_THRESHOLD_LEFT_MB)
+        if left_mb:
+            self._thresholds[THRESHOLD_LEFT_MB] = (left_mb, left_mb * (1 + HYSTERESIS_LEFT_MB_RATIO))
+        expiry_days = options.get(CONF_THRESHOLD_EXPIRY_DAYS, DEFAULT_THRESHOLD_EXPIRY_DAYS)
+        if expiry_days:
+            self._thresholds[THRESHOLD_EXPIRY] = (expiry_days, expiry_days + HYSTERESIS_EXPIRY_DAYS)
+        self._active: dict[str, set[str]] = {}
+        self._plan_types: dict[str, str] = {}
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = await self._store.async_load() or {}
+        self._active = {device_id: set(active) for device_id, active in stored.get("active", {}).items()}
+        self._plan_types = stored.get("plan_types", {})
+
+    @staticmethod
+    def _values(snapshot: DeviceSnapshot, now: datetime) -> dict[str, float | None]:
+        return {
+            THRESHOLD_LEFT_PERCENTAGE: snapshot.left_data_percentage,
+            THRESHOLD_LEFT_MB: snapshot.left_data_mb,
+            THRESHOLD_EXPIRY: (snapshot.expiry_date - now).total_seconds() / 86400 if snapshot.expiry_date else None,
+        }
+
+    @callback
+    def evaluate(self, snapshot: DeviceSnapshot, now: datetime) -> list[dict]:
+        """Events to fire for the device, one per threshold crossed since the last evaluation"""
+        device_id = snapshot.device_id
+        active = self._active.setdefault(device_id, set())
+        events = []
+        for threshold_type, value in self._values(snapshot, now).items():
+            if value is None or threshold_type not in self._thresholds:
+                continue
+            threshold, clear_value = self._thresholds[threshold_type]
+            if threshold_type not in active and value <= threshold:
+                active.add(threshold_type)
+                events.append(self._event(device_id, threshold_type, STATE_TRIGGERED, value, threshold))
+            elif threshold_type in active and value > clear_value:
+                active.discard(threshold_type)
+                events.append(self._event(device_id, threshold_type, STATE_CLEARED, value, threshold))
+
+        previous_plan_type = self._plan_types.get(device_id)
+        if previous_plan_type is not None and previous_plan_type != snapshot.plan_type:
+            events.append({"device_id": device_id, "type": THRESHOLD_PLAN_TYPE, "state": STATE_CHANGED,
+                           "previous": previous_plan_type, "value": snapshot.plan_type})
+        self._plan_types[device_id] = snapshot.plan_type
+
+        if events or previous_plan_type is None:
+            _LOGGER.debug("Threshold events of device %s: %s", device_id, events)
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY_SECONDS)
+        return events
+
+    @staticmethod
+    def _event(device_id: str, threshold_type: str, state: str, value: float, threshold: float) -> dict:
+        return {"device_id": device_id, "type": threshold_type, "state": state, "value": round(value, 2),
+                "threshold": threshold}
+
+    @callback
+    def forget_device(self, device_id: str) -> None:
+        self._active.pop(device_id, None)
+        self._plan_types.pop(device_id, None)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"active": {device_id: sorted(active) for device_id, active in self._active.items()},
+                "plan_types": self._plan_types}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
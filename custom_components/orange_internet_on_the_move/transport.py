@@ -0,0 +1,203 @@
+"""Transports carrying the HTTP calls of ObsHttpClient.
+
+AiohttpTransport calls the OBS API (or any host serving it, e.g. a mirror or a proxy).
+RecordingTransport wraps another transport and writes every call to a cassette file, with
+credentials, tokens and personal fields redacted. ReplayTransport serves the calls of a
+cassette without any network access, optionally with a latency.
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Callable, Mapping
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from .const import CASSETTE_VERSION
+from .log import REDACTED, SENSITIVE_KEYS, get_logger, redact
+
+_LOGGER = get_logger(__name__)
+
+# personal fields of the payloads, redacted in the cassettes on top of the secrets, as well as
+# every field of the user objects nested in the devices
+CASSETTE_REDACTED_KEYS = SENSITIVE_KEYS | {"email", "firstname", "lastname", "serial_number"}
+
+
+class TransportResponse(ABC):
+    """Response of a transport, the body is read once by read, json or iter_chunked"""
+
+    status: int
+    headers: Mapping[str, str]
+    content_length: int | None
+
+    @abstractmethod
+    async def read(self) -> bytes:
+        """Whole body"""
+
+    async def json(self) -> Any:
+        return json.loads(await self.read())
+
+    @abstractmethod
+    def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        """Body not read yet, in chunks of at most size bytes"""
+
+    def release(self) -> None:
+        """Gives the connection back, it is closed when the body was not read to the end"""
+
+    def close(self) -> None:
+        self.release()
+
+
+class Transport(ABC):
+    @abstractmethod
+    async def request(self, method: str, url: str, headers: dict) -> TransportResponse:
+        """Response of the call, its headers received and its body not necessarily read"""
+
+
+class BufferedResponse(TransportResponse):
+    """Response whose body is already in memory"""
+
+    def __init__(self, status: int, headers: Mapping[str, str], body: bytes):
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content_length = len(body)
+        self._body = body
+        # like a network response, chunks already iterated are not served again
+        self._position = 0
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        while self._position < len(self._body):
+            chunk = self._body[self._position:self._position + size]
+            self._position += len(chunk)
+            yield chunk
+
+
+class AiohttpResponse(TransportResponse):
+    def __init__(self, response: aiohttp.ClientResponse):
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+        self.content_length = response.content_length
+
+    async def read(self) -> bytes:
+        return await self._response.read()
+
+    async def json(self) -> Any:
+        return await self._response.json()
+
+    def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        return self._response.content.iter_chunked(size)
+
+    def release(self) -> None:
+        self._response.release()
+
+    def close(self) -> None:
+        self._response.close()
+
+
+class AiohttpTransport(Transport):
+    """Calls over an aiohttp session, looked up on every call as its owner may replace it"""
+
+    def __init__(self, session: Callable[[], aiohttp.ClientSession]):
+        self._session = session
+
+    async def request(self, method: str, url: str, headers: dict) -> TransportResponse:
+        return AiohttpResponse(await self._session().request(method, url, headers=headers))
+
+
+def _sanitize_body(body: bytes) -> str:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return redact(body.decode("utf-8", errors="replace"))
+    return json.dumps(_redact_keys(redact(payload)))
+
+
+def _redact_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _redact_user(item) if key == "user"
+                else REDACTED if str(key).lower() in CASSETTE_REDACTED_KEYS else _redact_keys(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact_keys(item) for item in value]
+    return value
+
+
+def _redact_user(value: Any) -> Any:
+    # the values are replaced but the keys kept, so the payload still decodes when replayed
+    if isinstance(value, dict):
+        return {key: REDACTED for key in value}
+    return REDACTED
+
+
+class RecordingTransport(Transport):
+    """Calls through another transport, each one appended to a cassette file.
+
+    Bodies are read in full to be recorded, so responses are not streamed while recording.
+    """
+
+    def __init__(self, transport: Transport, path: str | Path):
+        self._transport = transport
+        self._path = Path(path)
+        self._interactions: list[dict] = []
+        self._lock = asyncio.Lock()
+
+    async def request(self, method: str, url: str, headers: dict) -> TransportResponse:
+        response = await self._transport.request(method, url, headers)
+        try:
+            body = await response.read()
+        finally:
+            response.release()
+        self._interactions.append({
+            "request": {"method": method, "path": urlparse(url).path,
+                        "headers": redact(dict(headers))},
+            "response": {"status": response.status,
+                         "headers": redact(dict(response.headers)),
+                         "body": _sanitize_body(body)},
+        })
+        async with self._lock:
+            cassette = {"version": CASSETTE_VERSION, "interactions": list(self._interactions)}
+            await asyncio.get_running_loop().run_in_executor(None, self._write, cassette)
+        return BufferedResponse(response.status, response.headers, body)
+
+    def _write(self, cassette: dict) -> None:
+        self._path.write_text(json.dumps(cassette, indent=2), encoding="utf-8")
+
+
+class ReplayTransport(Transport):
+    """Serves the responses of a cassette, matched on method and path whatever the host.
+
+    The responses of a call recorded several times are served in order, the last one is then
+    repeated. A call missing from the cassette gets a 404.
+    """
+
+    def __init__(self, interactions: list[dict], latency: float = 0.0):
+        self.latency = latency
+        self._responses: dict[tuple[str, str], deque[dict]] = defaultdict(deque)
+        for interaction in interactions:
+            request = interaction["request"]
+            self._responses[(request["method"], request["path"])].append(interaction["response"])
+
+    @classmethod
+    def from_file(cls, path: str | Path, latency: float = 0.0) -> "ReplayTransport":
+        cassette = json.loads(Path(path).read_text(encoding="utf-8"))
+        if cassette.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"unsupported cassette version {cassette.get('version')!r}")
+        return cls(cassette["interactions"], latency)
+
+    async def request(self, method: str, url: str, headers: dict) -> TransportResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        responses = self._responses.get((method, urlparse(url).path))
+        if not responses:
+            _LOGGER.warning("No recorded response for %s %s", method, urlparse(url).path)
+            return BufferedResponse(404, {}, b"")
+        response = responses.popleft() if len(responses) > 1 else responses[0]
+        return BufferedResponse(response["status"], response["headers"], response["body"].encode())
@@ -0,0 +1,77 @@
+"""Fixtures of the tests, the OBS API is replayed from in memory interactions"""
+import json
+from datetime import timedelta
+
+import pytest
+from homeassistant.util import dt as dt_util
+
+from custom_components.orange_internet_on_the_move.client_registry import async_get_client_registry
+from custom_components.orange_internet_on_the_move.const import (
+    CONF_USERNAME, CONF_PASSWORD, ENDPOINT_LOGIN, ENDPOINT_DEVICES, ENDPOINT_DEVICE_CONSUMPTION,
+    ENDPOINT_DEVICE_SUBSCRIPTION,
+)
+from custom_components.orange_internet_on_the_move.transport import ReplayTransport
+
+USERNAME = "user@example.com"
+PASSWORD = "correct horse battery staple"
+CONFIG = {CONF_USERNAME: USERNAME, CONF_PASSWORD: PASSWORD}
+DEVICE_ID = "9b1c6a52-0f4e-4d0c-9a51-2f7d3c1e8a10"
+INITIAL_DATA_KB = 20 * 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    yield
+
+
+def interaction(method: str, path: str, body=None, status: int = 200, headers: dict | None = None) -> dict:
+    return {
+        "request": {"method": method, "path": path, "headers": {}},
+        "response": {"status": status, "headers": headers or {},
+                     "body": json.dumps(body) if body is not None else ""},
+    }
+
+
+def device_item(device_id: str = DEVICE_ID, tag: str = "Car") -> dict:
+    return {
+        "id": device_id,
+        "country": "FR",
+        "status": "ACTIVE",
+        "tag": tag,
+        "user": {"id": "user-0", "name": "Test User", "email": USERNAME},
+        "notification": {"email": True},
+        "puk": "12345678",
+        "serial_number": "SN00000001",
+        "creation_date": "2023-01-01T00:00:00+00:00",
+    }
+
+
+def consumption_item(left_data: int = INITIAL_DATA_KB // 2) -> dict:
+    now = dt_util.utcnow()
+    return {
+        "type": "onetime",
+        "initial_data": INITIAL_DATA_KB,
+        "left_data": left_data,
+        "start_date": (now - timedelta(days=10)).isoformat(),
+        "expiry_date": (now + timedelta(days=20)).isoformat(),
+    }
+
+
+def api_interactions(device_id: str = DEVICE_ID, subscription_status: int = 200) -> list[dict]:
+    device_path = f"{ENDPOINT_DEVICES}/{device_id}"
+    return [
+        interaction("POST", ENDPOINT_LOGIN, {}, headers={"x-auth-token": "token-1"}),
+        interaction("GET", ENDPOINT_DEVICES, [device_item(device_id)]),
+        interaction("GET", device_path + ENDPOINT_DEVICE_CONSUMPTION, [consumption_item()]),
+        interaction("GET", device_path + ENDPOINT_DEVICE_SUBSCRIPTION,
+                    {"name": "Plan", "status": "ACTIVE"} if subscription_status == 200 else {},
+                    status=subscription_status),
+    ]
+
+
+@pytest.fixture
+def replay(hass) -> ReplayTransport:
+    """Clients created by the integration are served the interactions of api_interactions"""
+    transport = ReplayTransport(api_interactions())
+    async_get_client_registry(hass).transport = transport
+    return transport
@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from homeassistant.util import dt as dt_util, slugify
+
+from custom_components.orange_internet_on_the_move.const import (
+    CONF_PASSWORD, ENDPOINT_DEVICES, ENDPOINT_LOGIN, STORAGE_KEY_TOKEN, STORAGE_VERSION, STREAM_CHUNK_BYTES,
+    STREAM_DRAIN_MAX_BYTES, TOKEN_EXPIRY_MARGIN_SECONDS,
+)
+from custom_components.orange_internet_on_the_move.log import REDACTED, redact
+from custom_components.orange_internet_on_the_move.metrics import endpoint_label
+from custom_components.orange_internet_on_the_move.OBSHttpClient import (
+    ApiError, CircuitOpenError, ObsHttpClient, TransientApiError,
+)
+from custom_components.orange_internet_on_the_move.resilience import CIRCUIT_CLOSED, CircuitBreaker, RetryPolicy
+from custom_components.orange_internet_on_the_move.transport import ReplayTransport
+from .conftest import CONFIG, DEVICE_ID, INITIAL_DATA_KB, USERNAME, api_interactions, consumption_item, interaction
+
+
+@pytest.fixture
+def client(hass) -> ObsHttpClient:
+    return ObsHttpClient(hass, CONFIG, ReplayTransport(api_interactions(subscription_status=403)))
+
+
+def stored_token(token: str, expires_at: datetime) -> dict:
+    key = STORAGE_KEY_TOKEN.format(slugify(USERNAME))
+    return {"version": STORAGE_VERSION, "minor_version": 1, "key": key, "data": {
+        "token": token, "issued_at": (expires_at - timedelta(hours=1)).isoformat(),
+        "expires_at": expires_at.isoformat()}}
+
+
+async def test_a_stored_token_is_reused_without_login(hass, hass_storage):
+    hass_storage[STORAGE_KEY_TOKEN.format(slugify(USERNAME))] = stored_token(
+        "stored-token-valid", dt_util.utcnow() + timedelta(hours=1))
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(api_interactions()))
+
+    await client.async_ensure_token()
+    assert client.auth_token == "stored-token-valid"
+    assert client.metrics.logins == 0
+
+
+async def test_an_expired_stored_token_is_replaced_by_a_login(hass, hass_storage):
+    key = STORAGE_KEY_TOKEN.format(slugify(USERNAME))
+    hass_storage[key] = stored_token("stored-token-expired", dt_util.utcnow() - timedelta(minutes=1))
+    expires_at = dt_util.utcnow().replace(microsecond=0) + timedelta(hours=2)
+    # a JWT, its expiry is read from the exp claim
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": int(expires_at.timestamp())}).encode()).decode()
+    jwt = f"header.{claims.rstrip('=')}.signature"
+    interactions = api_interactions()
+    interactions[0]["response"]["headers"] = {"x-auth-token": jwt}
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions))
+
+    await client.async_ensure_token()
+    assert client.auth_token == jwt
+    assert client.token_expires_at == expires_at
+    assert client.metrics.logins == 1
+    assert hass_storage[key]["data"]["token"] == jwt
+
+    # valid until the expiry margin
+    await client.async_ensure_token()
+    assert client.metrics.logins == 1
+    with patch.object(dt_util, "utcnow", return_value=expires_at - timedelta(seconds=TOKEN_EXPIRY_MARGIN_SECONDS)):
+        assert not client.is_token_valid()
+
+
+async def test_rejected_subscription_keeps_the_token_and_is_cached(client):
+    devices = await client.get_devices_info()
+    assert [device.device_id for device in devices] == [DEVICE_ID]
+    token = client.auth_token
+
+    for _ in range(2):
+        with pytest.raises(ApiError) as err:
+            await client.get_subscription_of_device(devices[0])
+        assert err.value.status == 403
+
+    assert client.auth_token == token
+    assert client.metrics.logins == 1
+    assert client.metrics.requests["GET /user-api/devices/{device_id}/subscription"] == 1
+
+
+async def test_a_null_subscription_body_is_an_api_error(hass):
+    interactions = api_interactions()
+    interactions[3]["response"]["body"] = "null"
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions))
+    device = (await client.get_devices_info())[0]
+
+    with pytest.raises(ApiError):
+        await client.get_subscription_of_device(device)
+    assert (await client.get_consumption_of_device(device)).left_data == INITIAL_DATA_KB // 2
+
+
+async def test_concurrent_device_streams_share_one_call(client):
+    async def stream() -> list[str]:
+        return [device.device_id async for device in client.async_iter_devices()]
+
+    results = await asyncio.gather(stream(), stream(), client.get_devices_info())
+    assert results[0] == results[1] == [DEVICE_ID]
+    assert [device.device_id for device in results[2]] == [DEVICE_ID]
+    assert client.metrics.requests["GET /user-api/devices"] == 1
+
+
+async def test_first_consumption_reads_the_small_rest_of_the_body(hass):
+    interactions = api_interactions()
+    path = interactions[2]["request"]["path"]
+    # older plans follow the current one, over more than one chunk
+    body = json.dumps([consumption_item()] + [consumption_item(INITIAL_DATA_KB)] * 200)
+    assert STREAM_CHUNK_BYTES < len(body) < STREAM_DRAIN_MAX_BYTES
+    interactions[2]["response"]["body"] = body
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions))
+    device = (await client.get_devices_info())[0]
+
+    consumption = await client.get_consumption_of_device(device)
+
+    assert consumption.left_data == INITIAL_DATA_KB // 2
+    # the body is read to the end so the connection can be reused
+    assert client.metrics.payload_bytes[endpoint_label("GET", path)] == len(body)
+
+
+async def test_password_and_replaced_tokens_are_redacted_only_while_in_use(hass):
+    interactions = api_interactions()
+    interactions[0] = interaction("POST", ENDPOINT_LOGIN, {}, headers={"x-auth-token": "first-token"})
+    interactions.insert(1, interaction("POST", ENDPOINT_LOGIN, {}, headers={"x-auth-token": "second-token"}))
+    password = "a password of this test only"
+    client = ObsHttpClient(hass, {**CONFIG, CONF_PASSWORD: password}, ReplayTransport(interactions))
+    # not validated yet
+    assert redact(password) == password
+
+    await client.authenticate_and_store_token()
+    assert redact(f"{password} first-token") == f"{REDACTED} {REDACTED}"
+    client.invalidate_token()
+    await client.authenticate_and_store_token()
+    assert redact("first-token second-token") == f"first-token {REDACTED}"
+
+    client.forget_secrets()
+    assert redact(f"{password} second-token") == f"{password} second-token"
+
+
+async def test_transient_failures_are_retried(hass):
+    interactions = api_interactions()
+    interactions.insert(1, interaction("GET", ENDPOINT_DEVICES, {}, status=503))
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions))
+    client.retry_policy = RetryPolicy(attempts=2, base_delay=0)
+
+    devices = await client.get_devices_info()
+
+    assert [device.device_id for device in devices] == [DEVICE_ID]
+    assert client.metrics.retries == 1
+    assert client.circuit_breaker.state == CIRCUIT_CLOSED
+
+
+async def test_the_circuit_opens_once_retries_keep_failing(hass):
+    interactions = api_interactions()
+    interactions[1] = interaction("GET", ENDPOINT_DEVICES, {}, status=500)
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions))
+    client.retry_policy = RetryPolicy(attempts=2, base_delay=0)
+    client.circuit_breaker = CircuitBreaker(failure_threshold=1, cool_down=60)
+
+    with pytest.raises(TransientApiError):
+        await client.get_devices_info()
+    requests = client.metrics.request_count
+    # refused without reaching the API
+    with pytest.raises(CircuitOpenError):
+        await client.get_devices_info()
+    assert client.metrics.request_count == requests
@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import pytest
+import voluptuous as vol
+from homeassistant import config_entries
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.data_entry_flow import FlowResultType
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.orange_internet_on_the_move.client_registry import async_get_client_registry
+from custom_components.orange_internet_on_the_move.const import (
+    CONF_MAX_CONCURRENT_REQUESTS, CONF_MAX_UPDATE_INTERVAL, CONF_MIN_UPDATE_INTERVAL, CONF_PASSWORD, DATA_COORDINATORS,
+    DOMAIN, GLOBAL_MAX_CONCURRENT_REQUESTS, HTTP_LIMIT_PER_HOST,
+)
+from .conftest import CONFIG, DEVICE_ID, USERNAME
+
+
+async def test_user_flow_hands_the_client_to_the_entry_setup(hass, replay):
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER})
+    assert result["type"] == FlowResultType.FORM
+
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], CONFIG)
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    await hass.async_block_till_done()
+
+    entry = hass.config_entries.async_entries(DOMAIN)[0]
+    assert entry.state is ConfigEntryState.LOADED
+    registry = async_get_client_registry(hass)
+    assert registry.has_client(USERNAME)
+    client = hass.data[DOMAIN][entry.entry_id]
+    # the login and the device list of the flow are reused by the first refresh
+    assert client.metrics.logins == 1
+    assert client.metrics.requests["GET /user-api/devices"] == 1
+    assert DEVICE_ID in hass.data[DOMAIN]["coordinators"][entry.entry_id].data
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert not registry.has_client(USERNAME)
+
+
+async def test_concurrent_requests_option_is_bounded_by_the_global_cap(hass, replay):
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    options = {CONF_MAX_CONCURRENT_REQUESTS: GLOBAL_MAX_CONCURRENT_REQUESTS + 1, CONF_MIN_UPDATE_INTERVAL: 5,
+               CONF_MAX_UPDATE_INTERVAL: 60}
+
+    with pytest.raises(vol.Invalid):
+        await hass.config_entries.options.async_configure(result["flow_id"], options)
+    assert HTTP_LIMIT_PER_HOST >= GLOBAL_MAX_CONCURRENT_REQUESTS
+
+
+async def test_reauth_swaps_the_password_in_place(hass, replay):
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    client = hass.data[DOMAIN][entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+
+    entry.async_start_reauth(hass)
+    await hass.async_block_till_done()
+    [flow] = hass.config_entries.flow.async_progress()
+    assert flow["step_id"] == "reauth_confirm"
+
+    with patch.object(coordinator, "async_refresh", wraps=coordinator.async_refresh) as async_refresh:
+        result = await hass.config_entries.flow.async_configure(flow["flow_id"], {CONF_PASSWORD: "new password"})
+        await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.ABORT
+    assert result["reason"] == "reauth_successful"
+    assert entry.data == {**CONFIG, CONF_PASSWORD: "new password"}
+    # the entry was not reloaded: same client, now with the new password, and a refresh resumed the polling
+    assert entry.state is ConfigEntryState.LOADED
+    assert hass.data[DOMAIN][entry.entry_id] is client
+    assert client.config[CONF_PASSWORD] == "new password"
+    assert hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id] is coordinator
+    async_refresh.assert_called_once()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+import voluptuous as vol
+
+from custom_components.orange_internet_on_the_move.decoder import (
+    DEVICE_SCHEMA, decode_items, decode_stream, decode_subscriptions, device_from_item, iter_json_array,
+)
+from .conftest import DEVICE_ID, device_item
+
+
+def test_null_fields_are_malformed_items_not_strings():
+    broken = {**device_item("other"), "tag": None}
+    devices = decode_items([device_item(), broken], DEVICE_SCHEMA, device_from_item)
+    assert [device.device_id for device in devices] == [DEVICE_ID]
+
+
+def test_null_subscription_fields_are_missing_values():
+    subscriptions = decode_subscriptions({"name": None, "status": "ACTIVE", "expiry_date": None})
+    assert subscriptions[0].name is None
+    assert subscriptions[0].status == "ACTIVE"
+    assert subscriptions[0].expiry_date is None
+
+
+async def chunks_of(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+@pytest.mark.parametrize("size", [1, 3, 1024])
+async def test_array_items_are_decoded_whatever_the_chunk_boundaries(size):
+    payload = [{"tag": "Café ☕", "values": [1, 2.5, None]}, 12345, "x", []]
+    items = [item async for item in iter_json_array(chunks_of(json.dumps(payload, ensure_ascii=False).encode(), size),
+                                                    max_bytes=1024)]
+    assert items == payload
+
+
+@pytest.mark.parametrize("body", [b'{"id": 1}', b'[{"id": 1}', b'[1 2]', b'[1,'])
+async def test_anything_but_a_complete_array_is_invalid(body):
+    with pytest.raises(vol.Invalid):
+        _ = [item async for item in iter_json_array(chunks_of(body, 4), max_bytes=1024)]
+
+
+async def test_bodies_over_the_limit_are_invalid():
+    with pytest.raises(vol.Invalid):
+        _ = [item async for item in iter_json_array(chunks_of(b"[" + b"1," * 100 + b"1]", 16), max_bytes=64)]
+
+
+async def test_malformed_items_of_a_stream_are_skipped():
+    body = json.dumps([device_item(), {"id": "broken"}, device_item("other")]).encode()
+    devices = [device async for device in decode_stream(chunks_of(body, 64), DEVICE_SCHEMA, device_from_item, 4096)]
+    assert [device.device_id for device in devices] == [DEVICE_ID, "other"]
@@ -0,0 +1,26 @@
+import json
+
+from homeassistant.components.diagnostics import REDACTED
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.orange_internet_on_the_move.const import CONF_PASSWORD, CONF_USERNAME, DATA_ORIGIN_LIVE, DOMAIN
+from custom_components.orange_internet_on_the_move.diagnostics import async_get_config_entry_diagnostics
+from .conftest import CONFIG, DEVICE_ID, PASSWORD, USERNAME
+
+
+async def test_diagnostics_redact_the_credentials_the_token_and_the_device_ids(hass, replay):
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+
+    assert diagnostics["entry"]["data"] == {CONF_USERNAME: REDACTED, CONF_PASSWORD: REDACTED}
+    assert diagnostics["api"]["token_valid"]
+    assert diagnostics["coordinator"]["data_origin"] == DATA_ORIGIN_LIVE
+    [device] = diagnostics["coordinator"]["devices"]
+    assert device["device_id"] == REDACTED
+    dumped = json.dumps(diagnostics, default=str)
+    for secret in (USERNAME, PASSWORD, DEVICE_ID, hass.data[DOMAIN][entry.entry_id].auth_token):
+        assert secret not in dumped
@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.orange_internet_on_the_move.const import DOMAIN, ENDPOINT_DEVICES, STAGGER_WINDOW_SECONDS
+from custom_components.orange_internet_on_the_move.global_scheduler import GlobalPollScheduler
+from custom_components.orange_internet_on_the_move.OBSHttpClient import ObsHttpClient
+from custom_components.orange_internet_on_the_move.transport import ReplayTransport
+from .conftest import CONFIG, DEVICE_ID, api_interactions, interaction
+
+
+async def test_entries_are_spread_over_the_stagger_window(hass):
+    scheduler = GlobalPollScheduler(hass)
+    MockConfigEntry(domain=DOMAIN, entry_id="entry-a").add_to_hass(hass)
+    assert scheduler.phase_offset("entry-a") == timedelta(0)
+
+    for entry_id in ("entry-c", "entry-b"):
+        MockConfigEntry(domain=DOMAIN, entry_id=entry_id).add_to_hass(hass)
+    offsets = [scheduler.phase_offset(entry_id) for entry_id in ("entry-a", "entry-b", "entry-c")]
+    window = timedelta(seconds=STAGGER_WINDOW_SECONDS)
+    assert offsets == [timedelta(0), window / 3, window * 2 / 3]
+    assert scheduler.phase_offset("unknown") == timedelta(0)
+
+
+async def test_a_429_pauses_the_requests_of_every_account(hass):
+    scheduler = GlobalPollScheduler(hass)
+    interactions = api_interactions()
+    interactions.insert(1, interaction("GET", ENDPOINT_DEVICES, {}, status=429, headers={"Retry-After": "0.1"}))
+    client = ObsHttpClient(hass, CONFIG, ReplayTransport(interactions), global_scheduler=scheduler)
+
+    with patch.object(scheduler, "throttle", wraps=scheduler.throttle) as throttle:
+        start = time.monotonic()
+        devices = await client.get_devices_info()
+    # retried once the provider allows it
+    assert [device.device_id for device in devices] == [DEVICE_ID]
+    assert time.monotonic() - start >= 0.09
+    throttle.assert_called_once_with(0.1)
+    assert client.metrics.retries == 1
+
+    # the pause is shared with the clients of the other accounts
+    scheduler.throttle(0.1)
+    start = time.monotonic()
+    async with scheduler.request_slot():
+        assert time.monotonic() - start >= 0.09
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from custom_components.orange_internet_on_the_move.dto import ConsumptionOfDevice
+from custom_components.orange_internet_on_the_move.history import ConsumptionHistory, ConsumptionHistoryStore
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+HOUR = 3600
+
+
+def test_the_ring_buffer_keeps_the_latest_samples_in_order():
+    history = ConsumptionHistory(capacity=3)
+    for hour in range(5):
+        assert history.append(START.timestamp() + hour * HOUR, 1000 - hour)
+    # older than the last sample
+    assert not history.append(START.timestamp(), 0)
+    assert len(history) == 3
+    assert [left for _, left in history.samples()] == [998, 997, 996]
+
+
+def test_rates_and_depletion_date():
+    history = ConsumptionHistory()
+    # 100 KB per hour over two days
+    for hour in range(49):
+        history.append(START.timestamp() + hour * HOUR, 10000 - 100 * hour)
+    assert history.burn_rate() == 100
+    assert history.average_daily_usage() == 2400
+    assert history.depletion_date() == START + timedelta(hours=100)
+
+
+def test_a_single_sample_gives_no_rate():
+    history = ConsumptionHistory()
+    history.append(START.timestamp(), 1000)
+    assert history.burn_rate() is None
+    assert history.depletion_date() is None
+
+
+def test_round_trip_through_storage_data():
+    history = ConsumptionHistory(start_date=START)
+    history.append(START.timestamp(), 1000)
+    history.append(START.timestamp() + HOUR, 900)
+    restored = ConsumptionHistory.from_dict(history.as_dict())
+    assert restored.start_date == START
+    assert list(restored.samples()) == list(history.samples())
+
+
+async def test_a_new_plan_period_resets_the_history(hass):
+    store = ConsumptionHistoryStore(hass, "entry-1")
+    await store.async_load()
+    plan = ConsumptionOfDevice("onetime", 2000, 1000, START + timedelta(days=30), START)
+    store.add_sample("device", plan, START + timedelta(hours=1))
+    store.add_sample("device", ConsumptionOfDevice("onetime", 2000, 900, plan.expiry_date, START),
+                     START + timedelta(hours=2))
+    assert len(store.get("device")) == 2
+
+    renewed = ConsumptionOfDevice("onetime", 2000, 2000, START + timedelta(days=60), START + timedelta(days=30))
+    history = store.add_sample("device", renewed, START + timedelta(days=30, hours=1))
+    assert len(history) == 1
+    assert history.start_date == renewed.start_date
@@ -0,0 +1,31 @@
+from custom_components.orange_internet_on_the_move.log import REDACTED, redact, register_secret, unregister_secret
+
+
+def test_secrets_are_redacted_as_whole_words_until_unregistered():
+    register_secret("hunter22")
+    try:
+        assert redact("password hunter22, token=hunter22") == f"password {REDACTED}, token={REDACTED}"
+        assert redact("xhunter22x") == "xhunter22x"
+    finally:
+        unregister_secret("hunter22")
+    assert redact("password hunter22") == "password hunter22"
+
+
+def test_short_secrets_do_not_garble_the_logs():
+    register_secret("p")
+    try:
+        assert redact("pppp p") == "pppp p"
+        assert redact({"password": "p"}) == {"password": REDACTED}
+    finally:
+        unregister_secret("p")
+
+
+def test_a_secret_shared_by_two_clients_stays_redacted_until_both_are_done():
+    register_secret("shared-password")
+    register_secret("shared-password")
+    unregister_secret("shared-password")
+    try:
+        assert redact("shared-password") == REDACTED
+    finally:
+        unregister_secret("shared-password")
+    assert redact("shared-password") == "shared-password"
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from homeassistant.components.recorder.statistics import get_last_statistics
+from pytest_homeassistant_custom_component.components.recorder.common import async_wait_recording_done
+
+from custom_components.orange_internet_on_the_move.dto import ConsumptionOfDevice, Device
+from custom_components.orange_internet_on_the_move.long_term_statistics import (
+    ConsumptionStatistics, DeviceUsage, spread_usage, statistic_id_of,
+)
+from .conftest import DEVICE_ID, INITIAL_DATA_KB
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+DEVICE = Device(DEVICE_ID, "FR", "ACTIVE", "Car", "user-0", "Test User", START, "SN00000001")
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations():
+    # the recorder must be set up before hass, the integration itself is not loaded here
+    yield
+
+
+def consumption(used_mb: float) -> ConsumptionOfDevice:
+    return ConsumptionOfDevice("onetime", INITIAL_DATA_KB, INITIAL_DATA_KB - int(used_mb * 1024),
+                               START + timedelta(days=30), START)
+
+
+def test_spread_usage_in_proportion_of_the_hours_spanned():
+    pending: dict[int, float] = {}
+    start = START.timestamp() + 1800
+    spread_usage(pending, start, start + 2 * 3600, 120.0)
+    hour = int(START.timestamp())
+    assert pending == {hour: 30.0, hour + 3600: 60.0, hour + 7200: 30.0}
+
+
+def test_completed_hours_keeps_the_current_hour_pending():
+    usage = DeviceUsage(START.timestamp(), INITIAL_DATA_KB, START)
+    usage.add_sample(consumption(150), (START + timedelta(hours=2, minutes=30)).timestamp())
+    statistics = usage.completed_hours((START + timedelta(hours=2, minutes=40)).timestamp())
+    assert [row["sum"] for row in statistics] == [60.0, 120.0]
+    assert usage.pending == {int((START + timedelta(hours=2)).timestamp()): 30.0}
+
+
+async def test_pending_hours_are_kept_without_the_recorder(hass):
+    statistics = ConsumptionStatistics(hass, "entry-1")
+    await statistics.async_add_sample(DEVICE, consumption(0), START)
+    await statistics.async_add_sample(DEVICE, consumption(100), START + timedelta(hours=2))
+    usage = statistics._devices[DEVICE_ID]
+    assert usage.sum == 0
+    assert sum(usage.pending.values()) == 100
+
+
+async def _last_sum(hass, statistic_id: str) -> float:
+    await async_wait_recording_done(hass)
+    last = await hass.async_add_executor_job(get_last_statistics, hass, 1, statistic_id, True, {"sum"})
+    return last[statistic_id][0]["sum"]
+
+
+async def test_one_entry_imports_a_device_and_the_next_one_resumes_its_sum(recorder_mock, hass):
+    statistic_id = statistic_id_of(DEVICE_ID)
+    first = ConsumptionStatistics(hass, "entry-1")
+    second = ConsumptionStatistics(hass, "entry-2")
+    for statistics in (first, second):
+        await statistics.async_add_sample(DEVICE, consumption(0), START)
+        await statistics.async_add_sample(DEVICE, consumption(100), START + timedelta(hours=2))
+    # the entries of one account see the same devices, only the first one imports them
+    assert DEVICE_ID not in second._devices
+    assert await _last_sum(hass, statistic_id) == 100
+
+    first.release_devices()
+    # the sum continues after the rows imported by the first entry instead of restarting at 0
+    await second.async_add_sample(DEVICE, consumption(100), START + timedelta(hours=3))
+    await second.async_add_sample(DEVICE, consumption(150), START + timedelta(hours=4))
+    assert await _last_sum(hass, statistic_id) == 150
@@ -0,0 +1,63 @@
+import pytest
+
+from custom_components.orange_internet_on_the_move import resilience
+from custom_components.orange_internet_on_the_move.resilience import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, RetryPolicy, parse_retry_after,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_after_repeated_failures_and_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cool_down=60)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow_request()
+
+    clock[0] += 60
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow_request()
+    # only the trial call goes through
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    clock[0] += 60
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_a_trial_without_outcome_is_replaced_after_a_cool_down(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cool_down=60)
+    breaker.record_failure()
+    clock[0] += 60
+    assert breaker.allow_request()
+    clock[0] += 30
+    assert not breaker.allow_request()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+
+def test_retry_delays_are_bounded():
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4)
+    assert 0 <= policy.delay(0) <= 1
+    assert 0 <= policy.delay(1) <= 2
+    assert policy.delay(2) is None
+    # the delay asked by the API is followed, unless longer than the longest delay
+    assert policy.delay(0, retry_after=3) == 3
+    assert policy.delay(0, retry_after=5) is None
+
+
+def test_retry_after_in_seconds_or_as_a_date():
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0
+    assert parse_retry_after("soon") is None
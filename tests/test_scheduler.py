@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+from custom_components.orange_internet_on_the_move.dto import ConsumptionOfDevice
+from custom_components.orange_internet_on_the_move.scheduler import AdaptivePollScheduler
+
+NOW = datetime(2024, 3, 1, tzinfo=timezone.utc)
+INITIAL_DATA = 1000
+
+
+def consumption(left_data: int = INITIAL_DATA // 2, expires_in: timedelta = timedelta(days=20)) -> ConsumptionOfDevice:
+    return ConsumptionOfDevice(type="onetime", initial_data=INITIAL_DATA, left_data=left_data,
+                               expiry_date=NOW + expires_in, start_date=NOW - timedelta(days=10))
+
+
+def scheduler() -> AdaptivePollScheduler:
+    return AdaptivePollScheduler(timedelta(minutes=10), timedelta(hours=6))
+
+
+def test_an_active_plan_is_polled_hourly_and_idle_ones_back_off():
+    poll_scheduler = scheduler()
+    intervals = [poll_scheduler.device_interval("device", consumption(), NOW) for _ in range(6)]
+    assert intervals == [timedelta(hours=1), timedelta(hours=1), timedelta(hours=2), timedelta(hours=4),
+                         timedelta(hours=6), timedelta(hours=6)]
+
+    # usage again, back to the nominal interval
+    assert poll_scheduler.device_interval("device", consumption(INITIAL_DATA // 3), NOW) == timedelta(hours=1)
+
+
+def test_plans_close_to_depletion_or_expiry_are_polled_more_often():
+    poll_scheduler = scheduler()
+    # 5% left, a fifth of the 25% low data ratio
+    assert poll_scheduler.device_interval("low", consumption(INITIAL_DATA // 20), NOW) == timedelta(minutes=12)
+    assert poll_scheduler.device_interval("expiring", consumption(expires_in=timedelta(hours=1)), NOW) \
+        == timedelta(minutes=15)
+    # never below the minimum interval
+    assert poll_scheduler.device_interval("last", consumption(expires_in=timedelta(minutes=10)), NOW) \
+        == timedelta(minutes=10)
+
+
+def test_an_expired_plan_is_polled_at_the_maximum_interval():
+    poll_scheduler = scheduler()
+    assert poll_scheduler.device_interval("device", consumption(expires_in=-timedelta(days=1)), NOW) \
+        == timedelta(hours=6)
+
+
+def test_the_coordinator_polls_at_the_shortest_device_interval():
+    poll_scheduler = scheduler()
+    assert poll_scheduler.next_interval() == timedelta(hours=1)
+    poll_scheduler.device_interval("expired", consumption(expires_in=-timedelta(days=1)), NOW)
+    poll_scheduler.device_interval("low", consumption(INITIAL_DATA // 20), NOW)
+    assert poll_scheduler.next_interval() == timedelta(minutes=12)
+
+    poll_scheduler.forget_device("low")
+    assert poll_scheduler.next_interval() == timedelta(hours=6)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+from dataclasses import asdict
+from unittest.mock import patch
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.helpers import entity_registry as er
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_capture_events
+
+from custom_components.orange_internet_on_the_move.client_registry import async_get_client_registry
+from custom_components.orange_internet_on_the_move.const import (
+    DATA_COORDINATORS, DATA_ORIGIN_LIVE, DATA_ORIGIN_RESTORED, DOMAIN, EVENT_THRESHOLD, STORAGE_KEY_HISTORY,
+    STORAGE_KEY_LAST_DATA, STORAGE_VERSION,
+)
+from custom_components.orange_internet_on_the_move.decoder import (
+    CONSUMPTION_SCHEMA, DEVICE_SCHEMA, consumption_from_item, device_from_item,
+)
+from custom_components.orange_internet_on_the_move.dto import OBSFullData
+from custom_components.orange_internet_on_the_move.last_data import _to_json
+from custom_components.orange_internet_on_the_move.long_term_statistics import ConsumptionStatistics
+from custom_components.orange_internet_on_the_move.sensor import OBSSensorEntity
+from custom_components.orange_internet_on_the_move.transport import ReplayTransport
+from .conftest import (
+    CONFIG, DEVICE_ID, INITIAL_DATA_KB, api_interactions, consumption_item, device_item, interaction,
+)
+
+
+async def setup_entry(hass) -> MockConfigEntry:
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    return entry
+
+
+async def test_sensor_names_are_scoped_to_their_device(hass, replay):
+    await setup_entry(hass)
+    entity_id = er.async_get(hass).async_get_entity_id("sensor", DOMAIN, f"{DEVICE_ID}_left_data")
+    state = hass.states.get(entity_id)
+    assert state.name == "Data Plan of Test User for Car Left data"
+    assert float(state.state) == INITIAL_DATA_KB // 2 / 1024
+
+
+async def test_only_the_entities_of_changed_fields_are_written(hass):
+    interactions = api_interactions()
+    async_get_client_registry(hass).transport = ReplayTransport(interactions)
+    entry = await setup_entry(hass)
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    client = hass.data[DOMAIN][entry.entry_id]
+    written = []
+    write_ha_state = OBSSensorEntity.async_write_ha_state
+
+    def record_write(entity: OBSSensorEntity) -> None:
+        written.append(entity.entity_description.key)
+        write_ha_state(entity)
+
+    with patch.object(OBSSensorEntity, "async_write_ha_state", record_write):
+        # same consumption as the first refresh, only the rates computed from the two samples change
+        client.invalidate_cache()
+        await coordinator.async_refresh()
+        assert set(written) == {"burn_rate", "average_daily_usage"}
+        written.clear()
+        client.invalidate_cache()
+        await coordinator.async_refresh()
+        assert written == []
+
+        item = json.loads(interactions[2]["response"]["body"])[0]
+        interactions[2] = interaction("GET", interactions[2]["request"]["path"],
+                                      [{**item, "left_data": INITIAL_DATA_KB // 4}])
+        client.transport = ReplayTransport(interactions)
+        client.invalidate_cache()
+        await coordinator.async_refresh()
+
+    assert {"left_data", "left_data_percentage"} <= set(written)
+    assert not {"start_date", "expiry_date", "initial_data", "plan_type", "subscription"} & set(written)
+    state = hass.states.get(er.async_get(hass).async_get_entity_id("sensor", DOMAIN, f"{DEVICE_ID}_left_data"))
+    assert float(state.state) == INITIAL_DATA_KB // 4 / 1024
+
+
+async def test_refresh_survives_a_rejected_subscription_and_fires_threshold_events(hass):
+    interactions = api_interactions(subscription_status=403)
+    interactions[2] = interaction("GET", interactions[2]["request"]["path"], [consumption_item(INITIAL_DATA_KB // 20)])
+    async_get_client_registry(hass).transport = ReplayTransport(interactions)
+    events = async_capture_events(hass, EVENT_THRESHOLD)
+
+    entry = await setup_entry(hass)
+
+    assert entry.state is ConfigEntryState.LOADED
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    assert coordinator.last_update_success
+    assert coordinator.data[DEVICE_ID].subscription is None
+    # the token accepted by the other endpoints is kept
+    assert hass.data[DOMAIN][entry.entry_id].metrics.logins == 1
+    assert [(event.data["type"], event.data["state"]) for event in events] == [("left_data_percentage", "triggered")]
+    assert events[0].data["config_entry_id"] == entry.entry_id
+
+
+async def test_a_null_subscription_body_does_not_fail_the_refresh(hass):
+    interactions = api_interactions()
+    interactions[3]["response"]["body"] = "null"
+    async_get_client_registry(hass).transport = ReplayTransport(interactions)
+
+    entry = await setup_entry(hass)
+
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    assert coordinator.last_update_success
+    assert coordinator.data[DEVICE_ID].subscription is None
+    assert er.async_get(hass).async_get_entity_id("sensor", DOMAIN, f"{DEVICE_ID}_left_data") is not None
+
+
+async def test_a_statistics_failure_does_not_fail_the_refresh(hass, replay):
+    with patch.object(ConsumptionStatistics, "async_add_sample", side_effect=RuntimeError("recorder down")):
+        entry = await setup_entry(hass)
+
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    assert coordinator.last_update_success
+    assert DEVICE_ID in coordinator.data
+
+
+def stored(key: str, data: dict) -> dict:
+    return {"version": STORAGE_VERSION, "minor_version": 1, "key": key, "data": data}
+
+
+async def test_startup_restores_the_last_data_then_refreshes_in_the_background(hass, hass_storage, replay):
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    full_data = OBSFullData(device_from_item(DEVICE_SCHEMA(device_item())),
+                            consumption_from_item(CONSUMPTION_SCHEMA(consumption_item())), None)
+    last_data_key = STORAGE_KEY_LAST_DATA.format(entry.entry_id)
+    hass_storage[last_data_key] = stored(last_data_key, {"devices": {DEVICE_ID: _to_json(asdict(full_data))}})
+    # 100 MB used in the hour before the last refresh
+    last_refresh = dt_util.utcnow().timestamp() - 600
+    left_data = full_data.consumption.left_data
+    history_key = STORAGE_KEY_HISTORY.format(entry.entry_id)
+    hass_storage[history_key] = stored(history_key, {"devices": {DEVICE_ID: {
+        "start_date": full_data.consumption.start_date.isoformat(),
+        "samples": [[last_refresh - 3600, left_data + 100 * 1024], [last_refresh, left_data]],
+    }}})
+    # the background refresh is still in flight while the restored data is checked
+    replay.latency = 0.1
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    registry = er.async_get(hass)
+    left_data_state = hass.states.get(registry.async_get_entity_id("sensor", DOMAIN, f"{DEVICE_ID}_left_data"))
+    burn_rate_state = hass.states.get(registry.async_get_entity_id("sensor", DOMAIN, f"{DEVICE_ID}_burn_rate"))
+    assert left_data_state.attributes["data_origin"] == DATA_ORIGIN_RESTORED
+    assert float(burn_rate_state.state) == 100
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    assert coordinator.obs_api_client.metrics.request_count == 0
+
+    for _ in range(100):
+        if not coordinator.restored:
+            break
+        await asyncio.sleep(0.05)
+    await hass.async_block_till_done()
+    left_data_state = hass.states.get(left_data_state.entity_id)
+    assert left_data_state.attributes["data_origin"] == DATA_ORIGIN_LIVE
@@ -0,0 +1,54 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.orange_internet_on_the_move.const import (
+    DATA_COORDINATORS, DATA_ORIGIN_LIVE, DOMAIN, SERVICE_REFRESH, SERVICE_REFRESH_BURST,
+)
+from .conftest import CONFIG, DEVICE_ID
+
+
+@pytest.fixture
+async def entry(hass, replay):
+    entry = MockConfigEntry(domain=DOMAIN, data=CONFIG)
+    entry.add_to_hass(hass)
+    # the debounce also keeps the result of a refresh for the calls following it
+    with patch("custom_components.orange_internet_on_the_move.sensor.SERVICE_REFRESH_DEBOUNCE_SECONDS", 0.01):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        yield entry
+
+
+async def call_refresh(hass) -> dict:
+    return await hass.services.async_call(DOMAIN, SERVICE_REFRESH, {}, blocking=True, return_response=True)
+
+
+async def test_refresh_calls_close_together_share_one_refresh(hass, entry):
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    with patch.object(coordinator, "async_refresh", wraps=coordinator.async_refresh) as async_refresh:
+        responses = await asyncio.gather(call_refresh(hass), call_refresh(hass))
+
+    assert async_refresh.call_count == 1
+    for response in responses:
+        entry_response = response[entry.entry_id]
+        assert entry_response["refreshed"]
+        assert entry_response["data_origin"] == DATA_ORIGIN_LIVE
+        assert list(entry_response["devices"]) == [DEVICE_ID]
+
+
+async def test_refresh_calls_beyond_the_burst_return_the_current_data(hass, entry):
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    with patch.object(coordinator, "async_refresh", wraps=coordinator.async_refresh) as async_refresh:
+        responses = []
+        for _ in range(SERVICE_REFRESH_BURST + 1):
+            responses.append(await call_refresh(hass))
+            # past the debounce, the next call is a new refresh
+            await asyncio.sleep(0.02)
+
+    assert async_refresh.call_count == SERVICE_REFRESH_BURST
+    assert [response[entry.entry_id]["refreshed"] for response in responses] == \
+        [True] * SERVICE_REFRESH_BURST + [False]
+    # the current data is still returned
+    assert list(responses[-1][entry.entry_id]["devices"]) == [DEVICE_ID]
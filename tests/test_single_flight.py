@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from custom_components.orange_internet_on_the_move.single_flight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution_and_its_result():
+    single_flight = SingleFlight(freshness=60)
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    assert await asyncio.gather(*(single_flight.run("key", fetch) for _ in range(3))) == [1, 1, 1]
+    # served from the completed result while fresh
+    assert await single_flight.run("key", fetch) == 1
+    assert await single_flight.run("key", fetch, fresh=False) == 2
+    single_flight.forget("key")
+    assert await single_flight.run("key", fetch) == 3
+
+
+async def test_failures_are_not_cached():
+    single_flight = SingleFlight(freshness=60)
+    results = iter([ValueError("first"), "second"])
+
+    async def fetch() -> str:
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    with pytest.raises(ValueError):
+        await single_flight.run("key", fetch)
+    assert await single_flight.run("key", fetch) == "second"
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    single_flight = SingleFlight(freshness=60)
+    release = asyncio.Event()
+
+    async def fetch() -> str:
+        await release.wait()
+        return "done"
+
+    cancelled = asyncio.ensure_future(single_flight.run("key", fetch))
+    waiting = asyncio.ensure_future(single_flight.run("key", fetch))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    assert await waiting == "done"
+
+
+async def test_streams_are_shared_and_cached_as_a_list():
+    single_flight = SingleFlight(freshness=60)
+    streams = 0
+
+    async def items():
+        nonlocal streams
+        streams += 1
+        for item in range(3):
+            await asyncio.sleep(0)
+            yield item
+
+    async def read() -> list[int]:
+        return [item async for item in single_flight.stream("key", items)]
+
+    assert await asyncio.gather(read(), read(), single_flight.run("key", lambda: asyncio.sleep(0, "unused"))) == \
+        [[0, 1, 2], [0, 1, 2], [0, 1, 2]]
+    assert await read() == [0, 1, 2]
+    assert streams == 1
+
+
+async def test_a_stream_failure_reaches_every_reader_after_the_items_produced():
+    single_flight = SingleFlight(freshness=60)
+
+    async def items():
+        yield 1
+        await asyncio.sleep(0)
+        raise ValueError("broken")
+
+    async def read(received: list) -> None:
+        async for item in single_flight.stream("key", items):
+            received.append(item)
+
+    first, second = [], []
+    results = await asyncio.gather(read(first), read(second), return_exceptions=True)
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert first == second == [1]
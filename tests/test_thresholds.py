@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from custom_components.orange_internet_on_the_move.const import (
+    CONF_THRESHOLD_EXPIRY_DAYS, CONF_THRESHOLD_LEFT_MB, CONF_THRESHOLD_LEFT_PERCENTAGE,
+)
+from custom_components.orange_internet_on_the_move.dto import DeviceSnapshot
+from custom_components.orange_internet_on_the_move.thresholds import ThresholdMonitor
+
+NOW = datetime(2024, 3, 10, tzinfo=timezone.utc)
+
+
+def snapshot(percentage: int, plan_type: str = "onetime") -> DeviceSnapshot:
+    return DeviceSnapshot("device", NOW - timedelta(days=10), NOW + timedelta(days=20), 1000.0, percentage * 10.0,
+                          percentage, plan_type)
+
+
+@pytest.fixture
+async def monitor(hass) -> ThresholdMonitor:
+    monitor = ThresholdMonitor(hass, "entry-1", {CONF_THRESHOLD_LEFT_PERCENTAGE: 10, CONF_THRESHOLD_LEFT_MB: 0,
+                                                 CONF_THRESHOLD_EXPIRY_DAYS: 0})
+    await monitor.async_load()
+    return monitor
+
+
+def states(events: list[dict]) -> list[tuple[str, str]]:
+    return [(event["type"], event["state"]) for event in events]
+
+
+async def test_alerts_fire_once_and_clear_past_the_hysteresis(monitor):
+    assert monitor.evaluate(snapshot(50), NOW) == []
+    assert states(monitor.evaluate(snapshot(10), NOW)) == [("left_data_percentage", "triggered")]
+    assert monitor.evaluate(snapshot(5), NOW) == []
+    # back above the threshold but within the hysteresis
+    assert monitor.evaluate(snapshot(11), NOW) == []
+    assert states(monitor.evaluate(snapshot(13), NOW)) == [("left_data_percentage", "cleared")]
+    assert states(monitor.evaluate(snapshot(9), NOW)) == [("left_data_percentage", "triggered")]
+
+
+async def test_plan_type_changes_are_reported(monitor):
+    monitor.evaluate(snapshot(50), NOW)
+    events = monitor.evaluate(snapshot(50, "recurring"), NOW)
+    assert events == [{"device_id": "device", "type": "plan_type", "state": "changed", "previous": "onetime",
+                       "value": "recurring"}]
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from custom_components.orange_internet_on_the_move.const import ENDPOINT_LOGIN
+from custom_components.orange_internet_on_the_move.log import REDACTED
+from custom_components.orange_internet_on_the_move.transport import (
+    RecordingTransport, ReplayTransport, Transport, TransportResponse,
+)
+from .conftest import interaction
+
+
+def test_transports_must_implement_their_calls():
+    with pytest.raises(TypeError):
+        Transport()
+    with pytest.raises(TypeError):
+        TransportResponse()
+
+
+async def test_cassettes_redact_tokens_and_cookies(tmp_path):
+    cassette = tmp_path / "cassette.json"
+    recorded = interaction("POST", ENDPOINT_LOGIN, {}, headers={"x-auth-token": "secret-token",
+                                                                  "Set-Cookie": "SESSION=secret-session"})
+    transport = RecordingTransport(ReplayTransport([recorded]), cassette)
+
+    response = await transport.request("POST", "https://example.com" + ENDPOINT_LOGIN,
+                                       {"Authorization": "Basic secret", "Cookie": "SESSION=secret-session"})
+
+    assert response.headers["x-auth-token"] == "secret-token"
+    text = cassette.read_text(encoding="utf-8")
+    assert "secret" not in text
+    interactions = json.loads(text)["interactions"]
+    assert interactions[0]["request"]["headers"]["Cookie"] == REDACTED
+    assert interactions[0]["response"]["headers"]["Set-Cookie"] == REDACTED